@@ -1,47 +1,32 @@
-import importlib
 import os
 import sys
+
+if __name__ == "__main__" and "--headless" in sys.argv[1:]:
+    # ヘッドレス起動では tkinter を読み込まない
+    from headless import main
+    sys.exit(main(sys.argv[1:]))
+
 import tkinter as tk
 from tkinter import messagebox
-from datetime import datetime
-from time import sleep
-from threading import Thread
-from math import ceil
-import logging
-import json
-import ADLXPybind as ADLX  # ADLXPybind.pydをインポート
-
-
-def import_with_install(package, module_name=None):
-    """
-    パッケージをインポートし、必要であれば自動でインストールする関数。
-    :param package: インストールするパッケージ名（pipで指定する名前）
-    :param module_name: インポート時に使用するモジュール名（デフォルトはpackageと同じ）
-    """
-    module_name = module_name or package
-    try:
-        globals()[module_name] = importlib.import_module(module_name)
-    except ImportError:
-        os.system(f"{sys.executable} -m pip install {package}")
-        globals()[module_name] = importlib.import_module(module_name)
-
-# 必要なライブラリをインポートまたはインストール
-import_with_install("python-osc", "pythonosc")
-from pythonosc.udp_client import SimpleUDPClient
-import_with_install("nvidia-ml-py3", "pynvml")
-import pynvml
+from chat_scheduler import ChatFeed
+from chat_template import FIELDS
+from config_store import JsonStore
+from engine import SendEngine
+from gpu_detect import detect_gpu
+from gpu_providers import GPUProviderError, GPULibraryNotFoundError
+from osc_sender import ceil_minifloat
+from preset_list import PresetList
+from watch_logging import setup_logging, stop_logging
+import watch_settings
+
 
 class OSCWatchApp:
-    # OSCパラメータ
-    AVATAR_PARAMS = {
-        "HourTenPlace"   : "/avatar/parameters/HourTenPlace",
-        "HourZeroPlace"  : "/avatar/parameters/HourZeroPlace",
-        "MinuteTenPlace" : "/avatar/parameters/MinuteTenPlace",
-        "MinuteZeroPlace": "/avatar/parameters/MinuteZeroPlace",
-        "GPUTenPlace"    : "/avatar/parameters/GPUTenPlace",
-        "GPUZeroPlace"   : "/avatar/parameters/GPUZeroPlace",
-        "VRAMTenPlace"   : "/avatar/parameters/VRAMTenPlace",
-        "VRAMZeroPlace"  : "/avatar/parameters/VRAMZeroPlace",
+    RATE_LABELS = {
+        "clock"  : "時計",
+        "gpuMin" : "GPU 最短",
+        "gpuMax" : "GPU 最長",
+        "chat"   : "チャット",
+        "system" : "CPU等",
     }
     # カレント取得
     currentDir = os.path.dirname(os.path.abspath(sys.executable if getattr(sys, 'frozen', False) else __file__))
@@ -55,110 +40,65 @@ class OSCWatchApp:
         script_dir = self.currentDir
         self.CHAT_PRESETS_FILE = os.path.join(script_dir, "chat_presets.json")
         self.SETTINGS_FILE = os.path.join(script_dir, "settings.json")
+        # 保存はまとめて別スレッドで書き、外での書き換えは watch_config() で反映する
+        self.presets_store = JsonStore(self.CHAT_PRESETS_FILE, logger=self.logger)
+        self.settings_store = JsonStore(self.SETTINGS_FILE, loader=watch_settings.load_settings, logger=self.logger)
 
-        self.gpu_vendor = self.detect_gpu_vendor()
         self.load_chat_presets()
         self.load_settings()
+        self.logger.setLevel(self.settings['logLevel'])
+        self.gpu_vendor = self.detect_gpu_vendor()
+        # チャットの内容はUIスレッドから公開し、送信スレッドは Tk を触らない
+        self.chat_feed = ChatFeed()
+        self.engine = SendEngine(
+            gpu_provider=self.gpu_provider,
+            gpu_vendor=self.gpu_vendor,
+            logger=self.logger,
+            chat_feed=self.chat_feed,
+            on_gpu_error=lambda e: self.root.after(0, self.handle_gpu_error, e),
+        )
+        if self.settings['metricsPort']:
+            try:
+                self.engine.serve_metrics(self.settings['metricsPort'])
+            except OSError as e:
+                self.console(f"Metrics endpoint error: {e}")
         self.create_widgets()
-        self.client = None
-        self.running = False
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.refresh_status()
+        self.watch_config()
         if self.defaultStart_var.get():
             self.start()
 
     def setup_logging(self):
         """ログファイル"""
-        # logフォルダを作成
-        script_dir = self.currentDir
-        log_dir = os.path.join(script_dir, "log")
-        os.makedirs(log_dir, exist_ok=True)
-        
-        # ログファイル名（日時付き）
-        log_filename = f"vrc_osc_watch_{datetime.now().strftime('%Y%m%d')}.log"
-        log_filepath = os.path.join(log_dir, log_filename)
-
-        logger = logging.getLogger(__name__)
-        logger.setLevel(logging.INFO)
-
-        if not logger.handlers:
-            fmt = logging.Formatter('%(asctime)s - %(message)s')
-            file_handler = logging.FileHandler(log_filepath, mode='a', encoding='utf-8')
-            file_handler.setFormatter(fmt)
-            stream_handler = logging.StreamHandler()
-            stream_handler.setFormatter(fmt)
-
-            logger.addHandler(file_handler)
-            logger.addHandler(stream_handler)
-
-        self.logger = logger
+        # logフォルダに日付・サイズで切り替わるログを出す (書き込みは別スレッド)
+        log_dir = os.path.join(self.currentDir, "log")
+        self.logger = setup_logging(log_dir)
 
     def detect_gpu_vendor(self):
         """GPU検出"""
-        # 1. NVIDIA外付け
-        try:
-            import pynvml
-            pynvml.nvmlInit()
-            count = pynvml.nvmlDeviceGetCount()
-            if count > 0:
-                handle = pynvml.nvmlDeviceGetHandleByIndex(0)
-                self.gpu_name = pynvml.nvmlDeviceGetName(handle).decode("utf-8")
-                pynvml.nvmlShutdown()
-                return "NVIDIA"
-        except:
-            pass
-
-        # 2. AMD外付け
-        try:            
-            # ADLXHelperで初期化
-            self.adlx_helper = ADLX.ADLXHelper()
-            self.ret = self.adlx_helper.Initialize()
-            if self.ret != ADLX.ADLX_RESULT.ADLX_OK:
-                pass
-            
-            # System Services取得
-            system = self.adlx_helper.GetSystemServices()
-            if system is None:
-                print("Failed to get system services")
-                self.adlx_helper.Terminate()
-                return
-
-            # Performance Monitoring Services取得
-            self.perf_monitoring = system.GetPerformanceMonitoringServices()
-            if self.perf_monitoring is None:
-                print("Failed to get performance monitoring services")
-                self.adlx_helper.Terminate()
-                return
-            
-            # GPUリスト取得
-            gpu_list = system.GetGPUs()
-            if gpu_list is None:
-                print("Failed to get GPU list")
-                self.adlx_helper.Terminate()
-                return
-
-            # 最初のGPUでメトリクス取得（複数GPUの場合ループ）
-            self.gpu = gpu_list[0]  # 最初のGPU
-            self.metrics_support = self.perf_monitoring.GetSupportedGPUMetrics(self.gpu)
-            if self.ret != ADLX.ADLX_RESULT.ADLX_OK:
-                print("Failed to get metrics support")
-                self.adlx_helper.Terminate()
-                return
-            
-            self.console("ADLXHelperで初期化成功")
-            self.gpu_name = self.gpu.Name()
-            return "RADEON"
-        except:
-            pass
+        self.gpu_provider = None
+        self.gpu_name = None
 
-        # 3. 内蔵GPU
+        # 前回検出したGPUが残っていればそれだけを開く。無ければ全プロバイダを並列に試す
+        # (1. NVIDIA外付け 2. AMD外付け 3. Linux(sysfs) 4. 内蔵GPU の順に優先)
+        provider_name = self.settings['gpuProvider']
         try:
-            import wmi
-            c = wmi.WMI()
-            gpus = c.Win32_VideoController()
-            if gpus:
-                self.gpu_name = gpus[0].Name
-                return "INTEGRATED"
-        except:
+            detection = detect_gpu(
+                provider_name, self.settings['gpuCache'],
+                devices=self.settings['gpuDevices'], aggregate=self.settings['gpuAggregate'],
+            )
+        except GPUProviderError as e:
+            self.console(f"GPU provider error ({provider_name}): {e}")
             return None
+        self.gpu_provider = detection.provider
+        self.gpu_name = detection.name
+        if self.gpu_provider is not None:
+            self.console(f"GPU provider opened: {type(self.gpu_provider).__name__} ({self.gpu_name})")
+        if provider_name == "auto" and detection.cache is not None and detection.cache != self.settings['gpuCache']:
+            self.settings['gpuCache'] = detection.cache
+            self.save_settings_file()
+        return detection.vendor
 
     def create_widgets(self):
         # 基本設定エリア
@@ -166,23 +106,30 @@ class OSCWatchApp:
         tk.Label(self.root, text="IP Address").grid(row=0, column=0, sticky="w", pady=2)
         self.ip_entry = tk.Entry(self.root)
         self.ip_entry.grid(row=0, column=1, sticky="ew", pady=2)
-        self.ip_entry.insert(0, "127.0.0.1")
+        self.ip_entry.insert(0, self.settings['ip'])
 
         # Port
         tk.Label(self.root, text="Port").grid(row=1, column=0, sticky="w", pady=2)
         self.port_entry = tk.Entry(self.root)
         self.port_entry.grid(row=1, column=1, sticky="ew", pady=2)
-        self.port_entry.insert(0, "9000")
-
-        # Interval
-        tk.Label(self.root, text="送信間隔 (秒)").grid(row=2, column=0, sticky="w", pady=2)
-        self.interval_entry = tk.Entry(self.root)
-        self.interval_entry.grid(row=2, column=1, sticky="ew", pady=2)
-        self.interval_entry.insert(0, "5")
-        self.interval_entry.config(state="readonly")
+        self.port_entry.insert(0, str(self.settings['port']))
+
+        # Interval（グループ毎）
+        rate_frame = tk.LabelFrame(self.root, text="送信間隔 (秒)")
+        rate_frame.grid(row=2, column=0, columnspan=2, sticky="ew", pady=2)
+        self.rate_entries = {}
+        for i, (key, label) in enumerate(self.RATE_LABELS.items()):
+            tk.Label(rate_frame, text=label).grid(row=0, column=i * 2, sticky="w", padx=(2, 0))
+            entry = tk.Entry(rate_frame, width=5)
+            entry.grid(row=0, column=i * 2 + 1, sticky="w", padx=(0, 4))
+            entry.insert(0, f"{self.settings['rates'][key]:g}")
+            self.rate_entries[key] = entry
 
         # Default Start
-        tk.Checkbutton(self.root, text="起動時にStart開始", variable=self.defaultStart_var, command=self.save_settings).grid(row=3, column=0, columnspan=2, sticky="w")
+        tk.Checkbutton(self.root, text="起動時にStart開始", variable=self.defaultStart_var, command=self.save_settings).grid(row=3, column=0, sticky="w")
+
+        # Bundle mode（1ティック分をまとめて1パケットで送信）
+        tk.Checkbutton(self.root, text="まとめて送信 (バンドル)", variable=self.bundle_var, command=self.save_settings).grid(row=3, column=1, sticky="w")
 
         # Start/Stop buttons frame
         button_frame = tk.Frame(self.root)
@@ -203,7 +150,9 @@ class OSCWatchApp:
 
         # 詳細設定の中身
         # チャットメッセージ入力エリア
-        tk.Label(self.advanced_frame, text="チャットメッセージ:").grid(row=0, column=0, columnspan=2, sticky="w", pady=2)
+        tk.Label(self.advanced_frame, text="チャットメッセージ:").grid(row=0, column=0, sticky="w", pady=2)
+        # テンプレートで使える置き換え
+        tk.Label(self.advanced_frame, text=" ".join(f"{{{field}}}" for field in FIELDS), fg="gray").grid(row=0, column=1, sticky="e", pady=2)
         
         # スクロール付きテキストボックス
         self.chat_frame = tk.Frame(self.advanced_frame)
@@ -217,6 +166,8 @@ class OSCWatchApp:
         self.chat_text.bind('<KeyRelease>', self.on_chat_text_change)
         self.chat_text.bind('<Button-1>', self.on_chat_text_change)
         self.chat_text.bind('<Control-v>', self.on_chat_text_change)
+        # 入力・貼り付け・プリセット選択のどれで変わっても送信スレッドへ公開する
+        self.chat_text.bind('<<Modified>>', self.on_chat_text_modified)
         
         self.chat_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         self.chat_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
@@ -228,9 +179,18 @@ class OSCWatchApp:
         # プリセット表示エリア
         self.preset_label = tk.Label(self.advanced_frame, text="プリセットメッセージ:")
         self.preset_label.grid(row=3, column=0, columnspan=2, sticky="w", pady=2)
-        self.presets_frame = tk.Frame(self.advanced_frame)
-        self.presets_frame.grid(row=4, column=0, columnspan=2, sticky="ew", pady=2)
-        self.update_preset_buttons()
+        # 見えている行だけウィジェットを作り、変更時は中身だけ書き換える
+        self.preset_list = PresetList(
+            self.advanced_frame, self.chat_presets,
+            on_select=lambda i: self.add_preset_to_chat(self.chat_presets[i]),
+            on_delete=self.delete_preset,
+            on_move=self.move_preset,
+        )
+        self.preset_list.grid(row=4, column=0, columnspan=2, sticky="ew", pady=2)
+
+        # プリセットを順番に送信 (プレイリスト)
+        self.chat_rotate_button = tk.Checkbutton(self.advanced_frame, text="プリセットを順番に送信", variable=self.chat_rotate_var, command=self.on_chat_rotate_change)
+        self.chat_rotate_button.grid(row=5, column=0, columnspan=2, sticky="w", pady=2)
 
         # 詳細設定フレームの列の重みを設定
         self.advanced_frame.columnconfigure(1, weight=1)
@@ -244,6 +204,10 @@ class OSCWatchApp:
         self.gpu_info_label = tk.Label(self.root, text=gpu_info_text, fg="blue", justify="left")
         self.gpu_info_label.grid(row=8, column=0, columnspan=2, sticky="w", pady=0)
 
+        # 計測値表示
+        self.metrics_label = tk.Label(self.root, text="", fg="gray", justify="left")
+        self.metrics_label.grid(row=9, column=0, columnspan=2, sticky="w", pady=0)
+
         # グリッドの列の重みを設定（エントリーフィールドが伸縮するように）
         self.root.columnconfigure(1, weight=1)
         
@@ -276,9 +240,11 @@ class OSCWatchApp:
         
         self.chat_text.config(state=new_state)
         self.save_preset_button.config(state=new_state)
-        
-        # プリセットボタンのUIを再構築（適切な状態で）
-        self.update_preset_buttons()
+        self.chat_rotate_button.config(state=new_state)
+        self.publish_chat()
+
+        # プリセットボタンの有効/無効だけを切り替える
+        self.preset_list.set_enabled(self.chat_enabled_var.get())
 
     def on_chat_text_change(self, event=None):
         """チャットテキスト変更時のイベントハンドラー"""
@@ -286,25 +252,52 @@ class OSCWatchApp:
             # 少し遅延させてステータス更新（連続入力時の負荷軽減）
             self.root.after(500, self.update_status_display)
 
+    def on_chat_text_modified(self, event=None):
+        """チャットテキストの内容が変わったら公開し直す"""
+        if self.chat_text.edit_modified():
+            self.publish_chat()
+            # 次の変更でもイベントが来るようにフラグを戻す
+            self.chat_text.edit_modified(False)
+
+    def on_chat_rotate_change(self):
+        """プレイリスト送信の切り替え"""
+        self.save_settings()
+        self.publish_chat()
+
+    def publish_chat(self):
+        """送信するチャットの内容を送信スレッドへ公開する (UIスレッドからだけ呼ぶ)"""
+        if not self.chat_enabled_var.get():
+            self.chat_feed.publish(None)
+            return
+        playlist = self.chat_presets if self.chat_rotate_var.get() else ()
+        self.chat_feed.publish(self.chat_text.get("1.0", tk.END).strip(), playlist)
+
     def start(self):
         try:
             ip = self.ip_entry.get()
             port = int(self.port_entry.get())
-            interval = float(self.interval_entry.get())
-            sync = interval  # intervalと同じ値を使用
-            self.client = SimpleUDPClient(ip, port)
-            self.running = True
+            rates = {key: float(entry.get()) for key, entry in self.rate_entries.items()}
+            if any(rate <= 0 for rate in rates.values()):
+                raise ValueError("送信間隔は0より大きい値を指定してください。")
+            self.settings.update(ip=ip, port=port, rates=rates)
+            self.save_settings()
+            # 画面の送信先 + settings.json の追加送信先へ同じ内容を送る
+            # 既に送信中なら二重に開始しない
+            self.engine.start(watch_settings.engine_config(self.settings))
             self.update_status_display()
-            Thread(target=self.send_messages, args=(interval, sync), daemon=True).start()
         except Exception as e:
             error_msg = f"Start error: {str(e)}"
             self.console(error_msg)
             messagebox.showerror("Error", str(e))
 
     def stop(self):
-        self.running = False
+        self.engine.stop()
         self.update_status_display()
 
+    @property
+    def running(self):
+        return self.engine.running
+
     def update_status_display(self):
         """ステータス表示を更新する"""
         if self.running:
@@ -321,35 +314,33 @@ class OSCWatchApp:
             send_info_text = ", ".join(send_info)
             
             full_text = f"{status_text}\n送信情報: {send_info_text}"
+
+            # 送信先毎の送信数 (詰まっている送信先は破棄数が増える)
+            for dest in self.engine.stats():
+                full_text += f"\n→ {dest['name']}: {dest['sent_packets']} pkt"
+                if dest['dropped_packets']:
+                    full_text += f" / 破棄 {dest['dropped_packets']}"
         else:
             full_text = "ステータス: Stop"
             color = "red"
         
         self.status_label.config(text=full_text, fg=color)
 
-    def get_gpu_usage_v2(self):
-        if self.gpu_vendor == "NVIDIA":
-            return self.get_nvidia_gpu_usage()
-        elif self.gpu_vendor == "RADEON":
-            return self.get_amd_gpu_usage()
-        elif self.gpu_vendor == "INTEGRATED":
-            self.console("内蔵GPUを検出")
-        else:
-            self.console("警告: 対応していないGPUです。")
-        self.console("GPU使用率は0%として表示されます。")
-        self.console("gpu_vendor:" + self.gpu_vendor)        
-        return 0, 0
-
-    def get_nvidia_gpu_usage(self):
-        """NVIDIA GPU使用率を取得"""
-        try:
-            pynvml.nvmlInit()
-            handle = pynvml.nvmlDeviceGetHandleByIndex(0)
-            utilization = pynvml.nvmlDeviceGetUtilizationRates(handle)
-            memory_info = pynvml.nvmlDeviceGetMemoryInfo(handle)
-            pynvml.nvmlShutdown()
-            return int(utilization.gpu), int(memory_info.used / memory_info.total * 100)
-        except pynvml.NVMLError_LibraryNotFound:
+    def refresh_status(self):
+        """ステータスを定期的に更新する (送信タスクが途中で止まった場合も Stop 表示に戻す)"""
+        self.update_status_display()
+        if self.running:
+            m = self.engine.metrics.summary()
+            self.metrics_label.config(text=(
+                f"tick p50 {m['tick_p50_ms']:.2f}ms / p99 {m['tick_p99_ms']:.2f}ms  "
+                f"GPU読取 {m['gpu_read_ms']:.2f}ms  遅れ p99 {m['lateness_p99_ms']:.1f}ms\n"
+                f"送信 {m['packets']} / スキップ {m['skipped']} / GPUエラー {m['gpu_errors']}"
+            ))
+        self.root.after(1000, self.refresh_status)
+
+    def handle_gpu_error(self, error):
+        """GPUの読み取りエラーを表示して終了する"""
+        if isinstance(error, GPULibraryNotFoundError):
             self.show_copyable_command_dialog(
                 "グラボエラー",
                 
@@ -364,88 +355,19 @@ class OSCWatchApp:
                 "4) ファイルを貼り付け\n"
                 "このアプリを再起動してこのエラーがでないか確認してください。",
             )
-            sys.exit(1)
-        except Exception as e:
-            error_code = e.args[0] if e.args else "Unknown"
-            error_message = pynvml.nvmlErrorString(error_code) if hasattr(pynvml, "nvmlErrorString") else str(e)
-            self.console(f"Error Code: {error_code}")
-            self.console(f"Error Message: {error_message}")
-            messagebox.showerror("グラボエラー", f"想定されていないエラーです。\n製作者にお問い合わせお願いします。\nError Code: {error_code}\nError Message: {error_message}")
-            sys.exit(1)
-
-    def get_amd_gpu_usage(self):
-        # GPUUsageとVRAMUsageがサポートされているか確認
-        if self.metrics_support.IsSupportedGPUUsage() and self.metrics_support.IsSupportedGPUVRAM():
-            current_metrics = self.perf_monitoring.GetCurrentGPUMetrics(self.gpu)
-            if self.ret == ADLX.ADLX_RESULT.ADLX_OK and current_metrics is not None:
-                gpu_usage = current_metrics.GPUUsage()  # GPU利用率 (%)
-                vram_usage = current_metrics.GPUVRAM()  # VRAM使用量 (MB)
-                self.console(f"GpuName: {self.gpu.Name()} ")
-
-                self.console(f"GPU Utilization: {gpu_usage}%")
-                self.console(f"VRAM Usage: {vram_usage} MB")
-                # Total VRAM取得
-                total_vram = self.gpu.TotalVRAM()  # IADLXGPUのVRAMメソッドで総VRAM取得 (MB)
-                self.console(f"Total VRAM: {total_vram} MB")
-        return int(gpu_usage), int(vram_usage / total_vram * 100)
-        
-    def send_messages(self, interval, sync):
-        sync_count = int(sync / interval)
-        counters = {key: 0 for key in self.AVATAR_PARAMS.keys()}
-        self.console(f"GPU Vendor detected: {self.gpu_vendor}")
-        
-        while self.running:
-            now = datetime.now()
-            self.send_param("HourTenPlace", now.hour // 10, counters, sync_count)
-            self.send_param("HourZeroPlace", now.hour % 10, counters, sync_count)
-            self.send_param("MinuteTenPlace", now.minute // 10, counters, sync_count)
-            self.send_param("MinuteZeroPlace", now.minute % 10, counters, sync_count)
-            self.console(f"Sent: {now.strftime('%Y-%m-%d %H:%M:%S')}")
-            gpu, vram = self.get_gpu_usage_v2()
-            gpu = min(gpu, 99)
-            vram = min(vram, 99)
-            self.console(f"gpu:{gpu}% vram:{vram}% (vendor:{self.gpu_vendor})")
-            self.send_param("GPUTenPlace", gpu // 10, counters, sync_count)
-            self.send_param("GPUZeroPlace", gpu % 10, counters, sync_count)
-            self.send_param("VRAMTenPlace", vram // 10, counters, sync_count)
-            self.send_param("VRAMZeroPlace", vram % 10, counters, sync_count)
-            
-            # チャット送信処理
-            if self.chat_enabled_var.get():
-                self.send_chat_message()
-            
-            sleep(interval)
-
-    def send_param(self, param_name, value, counters, sync_count):
-        if counters[param_name] <= 0 or value != counters.get(f"prev_{param_name}", None):
-            self.client.send_message(self.AVATAR_PARAMS[param_name], value)
-            counters[param_name] = sync_count
-            counters[f"prev_{param_name}"] = value
-            self.console(f"Param: {param_name}, Address:{self.AVATAR_PARAMS[param_name]} Value: {value}")
-        else:
-            counters[param_name] -= 1
-
-    def send_chat_message(self):
-        """チャットメッセージをVRChatに送信する"""
-        try:
-            # テキストウィジェットからメッセージを取得
-            message = self.chat_text.get("1.0", tk.END).strip()
-            if message:
-                # VRChatのチャットボックスにメッセージを送信
-                self.client.send_message("/chatbox/input", [message, True, False])
-                self.console(f"Chat sent: {message}")
-            else:
-                self.console("Chat message is empty, skipping send")
-        except Exception as e:
-            error_msg = f"Chat send error: {str(e)}"
-            self.console(error_msg)
+            self.exit_app(1)
+        error_code = error.code if error.code is not None else "Unknown"
+        error_message = str(error)
+        self.console(f"Error Code: {error_code}")
+        self.console(f"Error Message: {error_message}")
+        messagebox.showerror("グラボエラー", f"想定されていないエラーです。\n製作者にお問い合わせお願いします。\nError Code: {error_code}\nError Message: {error_message}")
+        self.exit_app(1)
 
     def load_chat_presets(self):
         """チャットプリセットをJSONファイルから読み込む"""
         try:
-            if os.path.exists(self.CHAT_PRESETS_FILE):
-                with open(self.CHAT_PRESETS_FILE, 'r', encoding='utf-8') as f:
-                    self.chat_presets = json.load(f)
+            if self.presets_store.exists():
+                self.chat_presets = self.presets_store.load()
             else:
                 # 空のプリセットファイルを作成
                 self.chat_presets = []
@@ -455,81 +377,77 @@ class OSCWatchApp:
             self.chat_presets = []
 
     def save_chat_presets(self):
-        """チャットプリセットをJSONファイルに保存する"""
-        try:
-            with open(self.CHAT_PRESETS_FILE, 'w', encoding='utf-8') as f:
-                json.dump(self.chat_presets, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            self.console(f"Error saving chat presets: {e}")
+        """チャットプリセットをJSONファイルに保存する (書き込みは少し後にまとめて行う)"""
+        self.presets_store.save(self.chat_presets)
 
     def load_settings(self):
         """設定をJSONファイルから読み込む"""
         try:
-            if os.path.exists(self.SETTINGS_FILE):
-                with open(self.SETTINGS_FILE, 'r', encoding='utf-8') as f:
-                    settings = json.load(f)
-                    # デフォルトStart設定を読み込み
-                    self.defaultStart_var = tk.BooleanVar(value=settings.get('defaultStart', True))
-            else:
+            self.settings = self.settings_store.load()
+            if not self.settings_store.exists():
                 # デフォルト設定
-                self.defaultStart_var = tk.BooleanVar(value=True)
-                self.save_settings()
-            # チャット機能は初期状態で非活性
-            self.chat_enabled_var = tk.BooleanVar(value=False)
+                self.save_settings_file()
         except Exception as e:
             self.console(f"Error loading settings: {e}")
-            self.defaultStart_var = tk.BooleanVar(value=True)
-            self.chat_enabled_var = tk.BooleanVar(value=False)
+            self.settings = watch_settings.default_settings()
+        # デフォルトStart設定・バンドル送信設定
+        self.defaultStart_var = tk.BooleanVar(value=self.settings['defaultStart'])
+        self.bundle_var = tk.BooleanVar(value=self.settings['bundleMode'])
+        # チャット機能は初期状態で非活性
+        self.chat_enabled_var = tk.BooleanVar(value=False)
+        self.chat_rotate_var = tk.BooleanVar(value=self.settings['chat']['rotate'])
 
     def save_settings(self):
-        """設定をJSONファイルに保存する"""
+        """画面の設定を反映してJSONファイルに保存する"""
+        self.settings['defaultStart'] = self.defaultStart_var.get()
+        self.settings['bundleMode'] = self.bundle_var.get()
+        self.settings['chat']['rotate'] = self.chat_rotate_var.get()
+        self.save_settings_file()
+
+    def save_settings_file(self):
+        """設定をJSONファイルに保存する (書き込みは少し後にまとめて行う)"""
+        self.settings_store.save(self.settings)
+
+    def watch_config(self):
+        """設定ファイル・プリセットファイルが外で書き換えられていれば反映する"""
+        settings = self.settings_store.check()
+        if settings is not None:
+            self.apply_settings(settings)
+        presets = self.presets_store.check()
+        if isinstance(presets, list):
+            self.apply_presets(presets)
+        self.root.after(1000, self.watch_config)
+
+    def apply_settings(self, settings):
+        """読み直した設定を画面と送信中のエンジンに反映する (GPUプロバイダの変更は再起動後)"""
+        self.console("Settings reloaded")
+        self.settings = settings
+        self.logger.setLevel(settings['logLevel'])
+        self.ip_entry.delete(0, tk.END)
+        self.ip_entry.insert(0, settings['ip'])
+        self.port_entry.delete(0, tk.END)
+        self.port_entry.insert(0, str(settings['port']))
+        for key, entry in self.rate_entries.items():
+            entry.delete(0, tk.END)
+            entry.insert(0, f"{settings['rates'][key]:g}")
+        self.defaultStart_var.set(settings['defaultStart'])
+        self.bundle_var.set(settings['bundleMode'])
+        self.chat_rotate_var.set(settings['chat']['rotate'])
+        self.publish_chat()
+        # 送信中なら新しい設定で送信し直す
         try:
-            settings = {
-                'defaultStart': self.defaultStart_var.get()
-            }
-            with open(self.SETTINGS_FILE, 'w', encoding='utf-8') as f:
-                json.dump(settings, f, ensure_ascii=False, indent=2)
+            self.engine.reconfigure(watch_settings.engine_config(settings))
         except Exception as e:
-            self.console(f"Error saving settings: {e}")
-
-    def update_preset_buttons(self):
-        """プリセットボタンのUIを更新する"""
-        # 既存のウィジェットをクリア
-        for widget in self.presets_frame.winfo_children():
-            widget.destroy()
-
-        button_state = tk.NORMAL if self.chat_enabled_var.get() else tk.DISABLED
+            self.console(f"Start error: {str(e)}")
+            messagebox.showerror("Error", str(e))
+        self.update_status_display()
 
-        # プリセットボタンを再作成
-        for i, preset in enumerate(self.chat_presets):
-            preset_frame = tk.Frame(self.presets_frame)
-            preset_frame.pack(fill='x', pady=1)
-            
-            # 順序変更ボタン用のフレーム
-            order_frame = tk.Frame(preset_frame)
-            order_frame.pack(side='left')
-            
-            # 上へボタン（最初の要素以外で有効）
-            up_btn_state = button_state if (i > 0 and self.chat_enabled_var.get()) else tk.DISABLED
-            up_btn = tk.Button(order_frame, text="↑", width=2, 
-                             command=lambda idx=i: self.move_preset_up(idx), 
-                             state=up_btn_state)
-            up_btn.pack(side='left')
-            
-            # 下へボタン（最後の要素以外で有効）
-            down_btn_state = button_state if (i < len(self.chat_presets) - 1 and self.chat_enabled_var.get()) else tk.DISABLED
-            down_btn = tk.Button(order_frame, text="↓", width=2, 
-                               command=lambda idx=i: self.move_preset_down(idx), 
-                               state=down_btn_state)
-            down_btn.pack(side='left')
-            
-            # プリセットメッセージボタン
-            btn = tk.Button(preset_frame, text=preset, command=lambda p=preset: self.add_preset_to_chat(p), state=button_state, anchor='w')
-            btn.pack(side='left', expand=True, fill='x', padx=(1,0))
-            
-            # 削除ボタン
-            del_btn = tk.Button(preset_frame, text="削除", command=lambda p=preset: self.delete_preset(p), state=button_state)
-            del_btn.pack(side='right')
+    def apply_presets(self, presets):
+        """読み直したプリセットを一覧と送信中のプレイリストに反映する"""
+        self.console("Chat presets reloaded")
+        self.chat_presets[:] = presets
+        self.preset_list.refresh()
+        self.publish_chat()
 
     def add_preset_to_chat(self, preset_text):
         """プリセットテキストをチャット入力欄に設定する（既存テキストを置き換え）"""
@@ -541,28 +459,24 @@ class OSCWatchApp:
             if self.running:
                 self.update_status_display()
 
-    def delete_preset(self, preset_text):
+    def delete_preset(self, index):
         """プリセットを削除してUIとファイルを更新する"""
-        if preset_text in self.chat_presets:
-            self.chat_presets.remove(preset_text)
+        if 0 <= index < len(self.chat_presets):
+            del self.chat_presets[index]
             self.save_chat_presets()
-            self.update_preset_buttons()
+            self.preset_list.refresh()
+            self.publish_chat()
 
-    def move_preset_up(self, index):
-        """プリセットを一つ上に移動する"""
-        if index > 0 and index < len(self.chat_presets):
+    def move_preset(self, index, delta):
+        """プリセットを delta (-1: 上 / +1: 下) だけ移動する"""
+        target = index + delta
+        if 0 <= index < len(self.chat_presets) and 0 <= target < len(self.chat_presets):
             # 要素を入れ替え
-            self.chat_presets[index], self.chat_presets[index - 1] = self.chat_presets[index - 1], self.chat_presets[index]
+            self.chat_presets[index], self.chat_presets[target] = self.chat_presets[target], self.chat_presets[index]
             self.save_chat_presets()
-            self.update_preset_buttons()
-
-    def move_preset_down(self, index):
-        """プリセットを一つ下に移動する"""
-        if index >= 0 and index < len(self.chat_presets) - 1:
-            # 要素を入れ替え
-            self.chat_presets[index], self.chat_presets[index + 1] = self.chat_presets[index + 1], self.chat_presets[index]
-            self.save_chat_presets()
-            self.update_preset_buttons()
+            # 移動先が見えるようにして、見えている行だけ更新
+            self.preset_list.see(target)
+            self.publish_chat()
 
     def save_current_chat_as_preset(self):
         """現在のチャットメッセージをプリセットとして保存する"""
@@ -570,7 +484,8 @@ class OSCWatchApp:
         if message and message not in self.chat_presets:
             self.chat_presets.append(message)
             self.save_chat_presets()
-            self.update_preset_buttons()
+            self.preset_list.see(len(self.chat_presets) - 1)
+            self.publish_chat()
             self.chat_text.delete("1.0", tk.END) # 保存後に入力欄をクリア
             # ステータス表示を更新
             if self.running:
@@ -581,18 +496,33 @@ class OSCWatchApp:
         else:
             messagebox.showwarning("警告", "このメッセージは既にプリセットに存在します。")
 
+    def on_close(self):
+        """ウィンドウを閉じるときに送信を止めてGPUハンドルを解放する"""
+        self.engine.close()
+        if self.gpu_provider is not None:
+            self.gpu_provider.close()
+        # 書き込み待ちの設定・プリセットを書いてから終わる
+        self.settings_store.close()
+        self.presets_store.close()
+        stop_logging()
+        self.root.destroy()
+
+    def exit_app(self, code):
+        """on_close() で後片付け (書き込み待ちの設定の保存を含む) をしてから終了する"""
+        self.on_close()
+        sys.exit(code)
+
     def console(self, value):
         self.logger.info(value)
 
-    @staticmethod
-    def ceil_minifloat(value):
-        return ceil(value * 128) / 128
+    # パック送信の float と同じ刻み
+    ceil_minifloat = staticmethod(ceil_minifloat)
 
     def show_copyable_command_dialog(self, title, message):
         win = tk.Toplevel(self.root)
         win.title(title)
         tk.Label(win, text=message, justify="left").pack(padx=10, pady=(10,0))
-        tk.Button(win, text="閉じる", command=lambda: (win.destroy(), sys.exit(1))).pack(pady=10)
+        tk.Button(win, text="閉じる", command=lambda: (win.destroy(), self.exit_app(1))).pack(pady=10)
         win.grab_set()
         win.wait_window()
 
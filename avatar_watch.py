@@ -0,0 +1,139 @@
+"""
+アバターの切り替えの監視。
+
+VRChat から送られてくる OSC (受信ポート 9001) を別スレッドで受け取り、/avatar/change が来たら
+そのアバターの OSC 設定 JSON を読んで、アバターが受け付けるパラメータのアドレスを調べる。
+送信エンジンはこれを見て、アバターに無いパラメータを送らず、切り替え直後に全部を送り直す。
+
+    python -m avatar_watch --port 9001
+"""
+import argparse
+import glob
+import json
+import os
+import socket
+import threading
+import time
+
+from osc_sender import decode_packet
+
+# VRChat が OSC 設定 JSON を書き出すフォルダ (OSC/usr_xxx/Avatars/avtr_xxx.json)
+DEFAULT_OSC_DIR = os.path.join(os.path.expanduser("~"), "AppData", "LocalLow", "VRChat", "VRChat", "OSC")
+
+
+def load_avatar_config(avatar_id, osc_dir=DEFAULT_OSC_DIR):
+    """アバターの OSC 設定 JSON を探して読み込む (見つからなければ None)"""
+    for path in glob.glob(os.path.join(glob.escape(osc_dir), "usr_*", "Avatars", f"{glob.escape(avatar_id)}.json")):
+        # VRChat は BOM 付きで書き出す
+        with open(path, "r", encoding="utf-8-sig") as f:
+            return json.load(f)
+    return None
+
+
+def input_addresses(config):
+    """アバターが受け付ける (input のある) パラメータのアドレス"""
+    return frozenset(
+        param["input"]["address"]
+        for param in config.get("parameters", [])
+        if param.get("input") and param["input"].get("address")
+    )
+
+
+class AvatarWatcher:
+    """/avatar/change を受け取り、今のアバターが受け付けるアドレスを公開する"""
+
+    def __init__(self, host="127.0.0.1", port=9001, osc_dir=DEFAULT_OSC_DIR, on_change=None, logger=None):
+        """
+        :param on_change: アバターが切り替わったときに受信スレッドから呼ばれる関数
+        """
+        self.osc_dir = osc_dir
+        self.on_change = on_change
+        self.logger = logger
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.sock.settimeout(0.2)
+        self.port = self.sock.getsockname()[1]
+        self.avatar_id = None
+        # 今のアバターが受け付けるアドレス (分からない場合は None = 全部送る)
+        self.supported = None
+        # アバターが切り替わった回数 (送信側はこれが変わったら送り直す)
+        self.generation = 0
+        self.decode_errors = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="avatar-watch", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                data = self.sock.recv(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            try:
+                messages = decode_packet(data)
+            except Exception:
+                self.decode_errors += 1
+                continue
+            for address, args in messages:
+                # パラメータの値もまとめて届くが、見るのは切り替えだけ
+                if address == "/avatar/change" and args and isinstance(args[0], str):
+                    self.change(args[0])
+
+    def change(self, avatar_id):
+        """アバターの切り替えを反映する"""
+        try:
+            config = load_avatar_config(avatar_id, self.osc_dir)
+        except (OSError, ValueError) as e:
+            self._log(f"Failed to load avatar config ({avatar_id}): {e}")
+            config = None
+        supported = input_addresses(config) if config is not None else None
+        self._log(
+            f"Avatar changed: {avatar_id} "
+            f"({'config not found' if supported is None else f'{len(supported)} input parameters'})"
+        )
+        self.avatar_id = avatar_id
+        self.supported = supported
+        self.generation += 1
+        if self.on_change is not None:
+            self.on_change()
+
+    def accepts(self, address):
+        """今のアバターがアドレスを受け付けるか (分からない場合は True)"""
+        supported = self.supported
+        return supported is None or address in supported
+
+    def _log(self, message):
+        if self.logger is not None:
+            self.logger.info(message)
+
+    def close(self):
+        self._stopped.set()
+        self._thread.join()
+        self.sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="アバターの切り替えと受け付けるパラメータを表示する")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--osc-dir", default=DEFAULT_OSC_DIR)
+    args = parser.parse_args()
+
+    def on_change():
+        print(watcher.avatar_id, sorted(watcher.supported) if watcher.supported is not None else "(config not found)")
+
+    watcher = AvatarWatcher(args.host, args.port, args.osc_dir, on_change=on_change)
+    print(f"listening on {args.host}:{watcher.port}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
+if __name__ == "__main__":
+    main()
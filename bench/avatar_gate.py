@@ -0,0 +1,142 @@
+"""
+アバターの切り替えによる送信の絞り込みの確認。
+
+VRChat の代わりにローカルUDP受信口 (OSCSink) へ送り、アバターの監視ポートに /avatar/change を送って
+以下を確かめる。どれかが満たされなければ終了コード1で終わる。
+
+- 今のアバターの OSC 設定 JSON に無いパラメータが送られなくなる
+- 切り替え直後に、値が変わっていないパラメータも含めて受け付けるものが全部送り直される
+- 設定 JSON が見つからないアバターに切り替えたら全部を送る
+
+設定 JSON は一時フォルダに作るので VRChat は要らない。
+
+    python bench/avatar_gate.py
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from engine import SendEngine  # noqa: E402
+from gpu_providers import FakeProvider  # noqa: E402
+from osc_sender import encode_message  # noqa: E402
+from osc_sink import OSCSink  # noqa: E402
+
+CLOCK_PARAMS = ("HourTenPlace", "HourZeroPlace", "MinuteTenPlace", "MinuteZeroPlace")
+GPU_PARAMS = ("GPUTenPlace", "GPUZeroPlace", "VRAMTenPlace", "VRAMZeroPlace")
+
+
+def address(name):
+    return f"/avatar/parameters/{name}"
+
+
+def write_avatar(osc_dir, avatar_id, names):
+    """names を受け付けるアバターの OSC 設定 JSON を VRChat と同じ場所・形式 (BOM 付き) で書く"""
+    path = os.path.join(osc_dir, "usr_bench", "Avatars", f"{avatar_id}.json")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    config = {
+        "id": avatar_id,
+        "name": avatar_id,
+        "parameters": [
+            {"name": name, "input": {"address": address(name), "type": "Int"}, "output": {"address": address(name), "type": "Int"}}
+            for name in names
+        ],
+    }
+    with open(path, "w", encoding="utf-8-sig") as f:
+        json.dump(config, f)
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def engine_config(sink, watch_port, osc_dir, interval):
+    return {
+        "destinations": [{"ip": "127.0.0.1", "port": sink.port}],
+        "bundle": False,
+        "rates": {"clock": interval, "gpuMin": interval, "gpuMax": interval, "chat": interval, "system": interval},
+        # 送り直しがキープアライブと区別できるよう長くする
+        "keepalive": 60.0,
+        "logSummaryInterval": 3600.0,
+        "gpuSampling": {"rate": 0},
+        "avatarWatch": {"enabled": True, "port": watch_port, "oscDir": osc_dir},
+    }
+
+
+def received_after(sink, since):
+    """since 以降に受け取ったアドレス"""
+    return {address for t, address, _ in list(sink.messages) if t >= since}
+
+
+def switch(sock, watch_port, sink, avatar_id, settle):
+    """/avatar/change を送り、切り替え直後と落ち着いた後に受け取ったアドレスを返す"""
+    changed_at = time.monotonic()
+    sock.sendto(encode_message("/avatar/change", avatar_id), ("127.0.0.1", watch_port))
+    time.sleep(settle)
+    settled_at = time.monotonic()
+    time.sleep(settle)
+    return received_after(sink, changed_at), received_after(sink, settled_at)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="アバターの切り替えによる送信の絞り込みを確かめる")
+    parser.add_argument("--interval", type=float, default=0.02, help="各グループの間隔 (秒)")
+    parser.add_argument("--settle", type=float, default=0.3, help="切り替えを待つ時間 (秒)")
+    args = parser.parse_args()
+
+    osc_dir = tempfile.mkdtemp(prefix="avatar-gate-")
+    write_avatar(osc_dir, "avtr_clock", CLOCK_PARAMS)
+    write_avatar(osc_dir, "avtr_all", CLOCK_PARAMS + GPU_PARAMS)
+    watch_port = free_port()
+    sink = OSCSink(keep_messages=True)
+    provider = FakeProvider().open()
+    engine = SendEngine(provider, provider.vendor)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    clock = {address(name) for name in CLOCK_PARAMS}
+    gpu = {address(name) for name in GPU_PARAMS}
+    failures = []
+
+    def check(label, ok):
+        print(f"{label:<52} {'ok' if ok else 'FAILED'}")
+        if not ok:
+            failures.append(label)
+
+    try:
+        engine.start(engine_config(sink, watch_port, osc_dir, args.interval))
+        time.sleep(args.settle)
+        check("before any change: all parameters sent", clock | gpu <= received_after(sink, 0.0))
+
+        changed, settled = switch(sock, watch_port, sink, "avtr_clock", args.settle)
+        check("avtr_clock: clock parameters resent on change", clock <= changed)
+        check("avtr_clock: GPU parameters stopped", not gpu & settled)
+
+        changed, settled = switch(sock, watch_port, sink, "avtr_all", args.settle)
+        check("avtr_all: all parameters resent on change", clock | gpu <= changed)
+        check("avtr_all: GPU parameters sent again", gpu <= settled)
+
+        switch(sock, watch_port, sink, "avtr_clock", args.settle)
+        changed, settled = switch(sock, watch_port, sink, "avtr_missing", args.settle)
+        check("avtr_missing (no config): all parameters resent", clock | gpu <= changed)
+        check("avtr_missing (no config): GPU parameters sent", gpu <= settled)
+    finally:
+        sock.close()
+        engine.close()
+        provider.close()
+        sink.close()
+
+    print(f"sink received {sink.packets} packets / {sink.message_count} messages")
+    if failures:
+        print(f"{len(failures)} check(s) failed")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+OSC送信のマイクロベンチマーク。
+
+pythonosc の SimpleUDPClient.send_message と、
+事前エンコード済みデータグラム表 + 使い回しソケットの送信を比較する。
+
+    python bench/bench_osc_send.py [--ticks 20000]
+"""
+import argparse
+import os
+import socket
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from osc_sender import DatagramTable, Destination, OSCDatagramSender  # noqa: E402
+
+AVATAR_PARAMS = {
+    "HourTenPlace"   : "/avatar/parameters/HourTenPlace",
+    "HourZeroPlace"  : "/avatar/parameters/HourZeroPlace",
+    "MinuteTenPlace" : "/avatar/parameters/MinuteTenPlace",
+    "MinuteZeroPlace": "/avatar/parameters/MinuteZeroPlace",
+    "GPUTenPlace"    : "/avatar/parameters/GPUTenPlace",
+    "GPUZeroPlace"   : "/avatar/parameters/GPUZeroPlace",
+    "VRAMTenPlace"   : "/avatar/parameters/VRAMTenPlace",
+    "VRAMZeroPlace"  : "/avatar/parameters/VRAMZeroPlace",
+}
+
+
+def run_pythonosc(port, ticks):
+    from pythonosc.udp_client import SimpleUDPClient
+    client = SimpleUDPClient("127.0.0.1", port)
+    items = list(AVATAR_PARAMS.values())
+    for tick in range(ticks):
+        value = tick % 10
+        for address in items:
+            client.send_message(address, value)
+
+
+def run_table(port, ticks):
+    table = DatagramTable(AVATAR_PARAMS)
+    sender = OSCDatagramSender([Destination("127.0.0.1", port)])
+    names = list(AVATAR_PARAMS)
+    for tick in range(ticks):
+        value = tick % 10
+        for name in names:
+            sender.send(table.get(name, value), name)
+    sender.close()
+
+
+def measure(label, func, port, ticks):
+    func(port, min(ticks, 100))  # ウォームアップ
+    start = time.perf_counter()
+    func(port, ticks)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    func(port, min(ticks, 1000))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    packets = ticks * len(AVATAR_PARAMS)
+    print(f"{label:<12} {elapsed * 1e9 / packets:8.0f} ns/packet  {elapsed * 1e6 / ticks:8.1f} us/tick  peak alloc {peak} B")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--ticks", type=int, default=20000)
+    args = parser.parse_args()
+
+    # 受信はしない (ループバックのUDPなので送信側は詰まらない)
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(("127.0.0.1", 0))
+    port = sink.getsockname()[1]
+
+    table_time = measure("table", run_table, port, args.ticks)
+    try:
+        osc_time = measure("pythonosc", run_pythonosc, port, args.ticks)
+    except ImportError:
+        print("pythonosc is not installed, skipping comparison")
+    else:
+        print(f"speedup: x{osc_time / table_time:.1f}")
+    sink.close()
+
+
+if __name__ == "__main__":
+    main()
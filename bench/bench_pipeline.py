@@ -0,0 +1,208 @@
+"""
+送信パイプラインのベンチマーク。
+
+GPUの無い Linux でも動くように FakeProvider と、パケットをデコードするローカルUDP受信口を使い、
+SendEngine をヘッドレスで動かして以下を測る。
+
+- throughput: 間隔を極小にして詰めて回したときのティック/秒、CPU時間/ティック、
+  パケット/ティック、ティックあたりの残存メモリ確保量
+- jitter: 実際に近い間隔で回したときのスケジューラの遅れ
+
+結果は JSON で保存でき、--compare で前回の結果と比べて悪化していれば終了コード1で終わる。
+
+    python bench/bench_pipeline.py --output bench_output.json
+    python bench/bench_pipeline.py --compare bench_output.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from chat_scheduler import ChatFeed  # noqa: E402
+from engine import SendEngine  # noqa: E402
+from gpu_providers import FakeProvider  # noqa: E402
+from metrics import Metrics  # noqa: E402
+from osc_sink import OSCSink  # noqa: E402
+
+# 値が大きいほど悪い指標と、悪化とみなす割合
+REGRESSION_KEYS = {
+    "throughput.cpu_us_per_tick": 0.15,
+    "throughput.packets_per_tick": 0.05,
+    "throughput.retained_bytes_per_tick": 0.25,
+    "jitter.lateness_p99_ms": 0.50,
+}
+
+
+class RecordingHistogram:
+    """Histogram の代わりに生の値を全部とっておく"""
+
+    def __init__(self):
+        self.values = []
+
+    def observe(self, value):
+        self.values.append(value)
+
+    def percentile(self, q):
+        if not self.values:
+            return 0.0
+        ordered = sorted(self.values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def reset_metrics(engine):
+    engine.metrics = Metrics(engine.params)
+    engine.metrics.destination_stats = engine.stats
+    return engine.metrics
+
+
+def run_engine(engine, sink, rates, seconds, bundle, chat):
+    config = {
+        "destinations": [{"ip": "127.0.0.1", "port": sink.port}],
+        "bundle": bundle,
+        "rates": rates,
+        # 値が変わらないパラメータはティック毎に再送しない (本番と同じ10秒)
+        "keepalive": 10.0,
+        "logSummaryInterval": 3600.0,
+    }
+    engine.chat_feed = ChatFeed("bench") if chat else None
+    engine.start(config)
+    time.sleep(seconds)
+    engine.stop(wait=True)
+    # 受信スレッドが追いつくのを待つ
+    time.sleep(0.3)
+
+
+def bench_throughput(engine, sink, seconds, bundle, chat):
+    rates = {"clock": 0.0001, "gpuMin": 0.0001, "gpuMax": 0.0001, "chat": 0.0001}
+    metrics = reset_metrics(engine)
+    sink.reset()
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    run_engine(engine, sink, rates, seconds, bundle, chat)
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start - 0.3
+    ticks = max(metrics.ticks, 1)
+    packets, messages, decode_errors = sink.packets, sink.message_count, sink.decode_errors
+
+    # メモリ確保は tracemalloc を有効にした別の短い実行で測る (計測自体が遅いので)。
+    # リポジトリ内のコードが確保したまま残っている量をティック数で割る
+    metrics = reset_metrics(engine)
+    tracemalloc.start()
+    run_engine(engine, sink, rates, min(seconds, 1.0), bundle, chat)
+    _, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(
+        stat.size for stat in snapshot.statistics("filename")
+        if stat.traceback[0].filename.startswith(ROOT)
+    )
+    alloc_ticks = max(metrics.ticks, 1)
+
+    return {
+        "ticks": ticks,
+        "ticks_per_sec": ticks / wall,
+        "cpu_us_per_tick": cpu / ticks * 1e6,
+        "packets_per_tick": packets / ticks,
+        "messages_per_tick": messages / ticks,
+        "decode_errors": decode_errors,
+        "retained_bytes_per_tick": allocated / alloc_ticks,
+        "traced_peak_kib": peak / 1024,
+    }
+
+
+def bench_jitter(engine, sink, seconds, bundle, chat):
+    rates = {"clock": 0.05, "gpuMin": 0.02, "gpuMax": 0.05, "chat": 0.1}
+    metrics = reset_metrics(engine)
+    lateness = metrics.stages["lateness"] = RecordingHistogram()
+    sink.reset()
+    run_engine(engine, sink, rates, seconds, bundle, chat)
+    ticks = max(metrics.ticks, 1)
+    return {
+        "ticks": ticks,
+        "packets_per_tick": sink.packets / ticks,
+        "lateness_p50_ms": lateness.percentile(0.50) * 1000,
+        "lateness_p99_ms": lateness.percentile(0.99) * 1000,
+        "lateness_max_ms": max(lateness.values, default=0.0) * 1000,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def flatten(results):
+    return {
+        f"{section}.{key}": value
+        for section, values in results.items() if isinstance(values, dict)
+        for key, value in values.items()
+    }
+
+
+def compare(current, baseline_path):
+    """前回の結果より悪化した指標を返す"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = flatten(json.load(f))
+    current = flatten(current)
+    regressions = []
+    for key, tolerance in REGRESSION_KEYS.items():
+        if key not in baseline or key not in current or not baseline[key]:
+            continue
+        ratio = current[key] / baseline[key]
+        status = "REGRESSION" if ratio > 1 + tolerance else "ok"
+        print(f"{key:<38} {baseline[key]:10.3f} -> {current[key]:10.3f} (x{ratio:.2f}) {status}")
+        if status != "ok":
+            regressions.append(key)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="送信パイプラインのベンチマーク")
+    parser.add_argument("--seconds", type=float, default=3.0, help="各シナリオの実行時間")
+    parser.add_argument("--bundle", action="store_true", help="バンドルモードで測る")
+    parser.add_argument("--chat", action="store_true", help="チャット送信も含める")
+    parser.add_argument("--output", help="結果を保存するJSONファイル")
+    parser.add_argument("--compare", help="比較する前回の結果JSONファイル")
+    args = parser.parse_args()
+
+    sink = OSCSink()
+    engine = SendEngine(FakeProvider().open(), "FAKE")
+    try:
+        results = {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "options": {"bundle": args.bundle, "chat": args.chat, "seconds": args.seconds},
+            "throughput": bench_throughput(engine, sink, args.seconds, args.bundle, args.chat),
+            "jitter": bench_jitter(engine, sink, args.seconds, args.bundle, args.chat),
+        }
+    finally:
+        engine.close()
+        sink.close()
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        regressions = compare(results, args.compare)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+長時間運転 (ソーク) テスト。
+
+FakeProvider (2GPU) とローカルUDP受信口を相手に SendEngine を極小の間隔で回し続け、
+一定ティック毎に以下を記録する。ウォームアップ後も増え続けていれば終了コード1で終わる。
+
+- RSS (tracemalloc の管理領域を除く)、開いているファイルディスクリプタ数、スレッド数
+- tracemalloc で見た確保量と、増えている上位の確保元
+- ティックの遅れ (p50 / p99)
+
+GPUサンプラ・CPU等のソース・チャットのローテーション・ファイルへのログも本番と同じように動かし、
+途中で設定を変えた再起動 (reconfigure) も挟んで、開始・停止で漏れるものも見る。
+
+    python bench/soak.py --ticks 2000000
+    python bench/soak.py --ticks 200000 --checkpoints 10 --output soak.json
+"""
+import argparse
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_pipeline import RecordingHistogram, git_revision  # noqa: E402
+from chat_scheduler import ChatFeed  # noqa: E402
+from engine import SendEngine  # noqa: E402
+from gpu_providers import FakeProvider, MultiGPUProvider  # noqa: E402
+from osc_sink import OSCSink  # noqa: E402
+from watch_logging import DailyRotatingFileHandler, LOG_FORMAT  # noqa: E402
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+MIB = 1024 * 1024
+
+# 増加とみなす量: (指標, 表示名, 前半の平均から許す増加量を返す関数)
+TRENDS = (
+    ("rss", "RSS", lambda base: max(4 * MIB, base * 0.10)),
+    ("fds", "open fds", lambda base: 0),
+    ("threads", "threads", lambda base: 0),
+    ("traced", "tracemalloc", lambda base: max(1 * MIB, base * 0.20)),
+    ("lateness_p99_ms", "lateness p99", lambda base: max(1.0, base * 0.50)),
+)
+
+# tracemalloc 自身や import の確保は数えない
+TRACE_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return psutil.Process().memory_info().rss if psutil is not None else 0
+
+
+def open_fds():
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        if psutil is None:
+            return 0
+        process = psutil.Process()
+        # Windows はハンドル数
+        return process.num_handles() if hasattr(process, "num_handles") else process.num_fds()
+
+
+def os_threads():
+    """Python 以外 (ライブラリ) が作ったものも含めたスレッド数"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("Threads:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return threading.active_count()
+
+
+def open_logger(log_dir):
+    """本番と同じく、キュー経由で日付・サイズで切り替えるファイルに書くロガー (コンソールには出さない)"""
+    handler = DailyRotatingFileHandler(log_dir, max_bytes=256 * 1024, backup_count=2)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    log_queue = queue.SimpleQueue()
+    logger = logging.getLogger("soak")
+    logger.setLevel(logging.INFO)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.propagate = False
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    listener.start()
+    return logger, listener
+
+
+def engine_config(sink, interval, variant):
+    """variant 毎に少しずつ違う設定 (同じパラメータのまま再起動させる)"""
+    return {
+        "destinations": [{"ip": "127.0.0.1", "port": sink.port}],
+        "bundle": variant % 2 == 1,
+        "rates": {"clock": interval, "gpuMin": interval, "gpuMax": interval * 4, "chat": interval, "system": interval * 5},
+        "keepalive": 0.05,
+        "logSummaryInterval": 1.0,
+        "chat": {"refresh": 0.05, "rotateInterval": 0.02, "tokenRate": 1000.0, "tokenBurst": 10},
+        "gpuSampling": {"rate": 500.0, "window": 0.1, "mode": ("ema", "max", "percentile")[variant % 3]},
+        "gpuParams": {"1": {"gpu": "GPU1", "vram": "VRAM1"}},
+        "systemSources": {"cpu": "CPU", "ram": "RAM", "net": "NET"},
+        "encoding": {"clock": "digits", "gpu": "digits", "system": "digits"},
+    }
+
+
+def checkpoint_stats(engine, lateness, baseline):
+    stats = {
+        "ticks": engine.metrics.ticks,
+        # tracemalloc 自身の管理領域は除く
+        "rss": rss_bytes() - tracemalloc.get_tracemalloc_memory(),
+        "fds": open_fds(),
+        "threads": os_threads(),
+        "lateness_p50_ms": lateness.percentile(0.50) * 1000,
+        "lateness_p99_ms": lateness.percentile(0.99) * 1000,
+    }
+    snapshot = tracemalloc.take_snapshot().filter_traces(TRACE_FILTERS)
+    stats["traced"] = sum(stat.size for stat in snapshot.statistics("filename"))
+    if baseline is not None:
+        # ウォームアップ後から増えた確保元の上位
+        stats["top_growth"] = [
+            f"{stat.traceback[0].filename.replace(ROOT + os.sep, '')}:{stat.traceback[0].lineno} "
+            f"{stat.size_diff / 1024:+.1f}KiB ({stat.count_diff:+d})"
+            for stat in snapshot.compare_to(baseline, "lineno")[:5]
+            if stat.size_diff > 0
+        ]
+    return stats, snapshot
+
+
+def find_trends(checkpoints, warmup):
+    """
+    ウォームアップ後を3等分し、最初の1/3から最後の1/3までに許す量を超えて増え、
+    かつ真ん中の1/3からもその半分を超えて増えている (= 止まらずに増え続けている) 指標を返す。
+    前半で増えて後半で止まるもの (ヒープの温まりなど) は増加とみなさない。
+    """
+    samples = checkpoints[warmup:]
+    if len(samples) < 3:
+        print("Not enough checkpoints after warmup to check trends")
+        return []
+    third = len(samples) // 3
+    first, middle, last = samples[:third], samples[third:-third], samples[-third:]
+    trends = []
+    for key, label, allowance in TRENDS:
+        if key in ("fds", "threads"):
+            # 数は増えたら戻らないので最大値で比べる
+            before, during, after = (max(s[key] for s in part) for part in (first, middle, last))
+        else:
+            before, during, after = (sum(s[key] for s in part) / len(part) for part in (first, middle, last))
+        limit = allowance(before)
+        growing = after - before > limit and after - during > limit / 2
+        status = "GROWING" if growing else "ok"
+        print(f"{label:<14} {before:14.2f} -> {during:14.2f} -> {after:14.2f} ({after - before:+.2f}) {status}")
+        if growing:
+            trends.append(key)
+    return trends
+
+
+def main():
+    parser = argparse.ArgumentParser(description="送信エンジンの長時間運転テスト")
+    parser.add_argument("--ticks", type=int, default=2_000_000, help="回すティック数")
+    parser.add_argument("--checkpoints", type=int, default=20, help="記録する回数")
+    parser.add_argument("--warmup", type=int, help="比較に使わない最初の記録の数 (省略時は記録の1/4)")
+    parser.add_argument("--interval", type=float, default=0.0002, help="各グループの間隔 (秒)")
+    parser.add_argument("--restart-every", type=int, default=3, help="何回の記録毎に設定を変えて再起動するか (0で無効)")
+    parser.add_argument("--output", help="記録を保存するJSONファイル")
+    args = parser.parse_args()
+    if args.warmup is None:
+        args.warmup = args.checkpoints // 4
+
+    tracemalloc.start(1)
+    log_dir = tempfile.mkdtemp(prefix="soak-log-")
+    logger, listener = open_logger(log_dir)
+    sink = OSCSink()
+    feed = ChatFeed()
+    feed.publish(None, ("GPU {gpu}% VRAM {vram}%", "CPU {cpu}% RAM {ram}% {time}", "net {net}Mbps " + "x" * 150))
+    provider = MultiGPUProvider([FakeProvider(0, count=2).open(), FakeProvider(1, count=2).open()]).open()
+    engine = SendEngine(provider, provider.vendor, logger=logger, chat_feed=feed)
+
+    step = max(args.ticks // args.checkpoints, 1)
+    checkpoints = []
+    baseline = None
+    variant = 0
+    started = time.monotonic()
+    try:
+        engine.start(engine_config(sink, args.interval, variant))
+        lateness = engine.metrics.stages["lateness"] = RecordingHistogram()
+        print(f"{'ticks':>10} {'sec':>7} {'RSS MiB':>8} {'fds':>4} {'thr':>4} {'traced KiB':>10} {'p50 ms':>7} {'p99 ms':>7}")
+        for n in range(1, args.checkpoints + 1):
+            target = n * step
+            while engine.metrics.ticks < target:
+                if not engine.running:
+                    raise RuntimeError("Engine stopped unexpectedly")
+                time.sleep(0.05)
+            stats, snapshot = checkpoint_stats(engine, lateness, baseline)
+            stats["elapsed"] = time.monotonic() - started
+            checkpoints.append(stats)
+            if n == max(args.warmup, 1):
+                baseline = snapshot
+            print(
+                f"{stats['ticks']:>10} {stats['elapsed']:>7.1f} {stats['rss'] / MIB:>8.1f} {stats['fds']:>4} "
+                f"{stats['threads']:>4} {stats['traced'] / 1024:>10.1f} "
+                f"{stats['lateness_p50_ms']:>7.3f} {stats['lateness_p99_ms']:>7.3f}"
+            )
+            for line in stats.get("top_growth", [])[:3]:
+                print(f"{'':>12}{line}")
+            if args.restart_every and n % args.restart_every == 0 and n < args.checkpoints:
+                variant += 1
+                engine.reconfigure(engine_config(sink, args.interval, variant))
+            # 遅れは記録毎の区間で見る
+            lateness = engine.metrics.stages["lateness"] = RecordingHistogram()
+    finally:
+        engine.close()
+        provider.close()
+        sink.close()
+        listener.stop()
+        tracemalloc.stop()
+
+    trends = find_trends(checkpoints, args.warmup)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"revision": git_revision(), "options": vars(args), "checkpoints": checkpoints}, f, indent=2)
+    if trends:
+        print(f"{len(trends)} growing metric(s): {', '.join(trends)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
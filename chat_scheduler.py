@@ -0,0 +1,148 @@
+"""
+チャットボックスの送信スケジューラ。
+
+送信スレッドは Tk のウィジェットを読まず、UIスレッドが ChatFeed に公開した内容だけを見る。
+内容が変わったとき・一定時間ごとの再送だけ送信し、トークンバケットで送信数を抑える。
+プリセットを順番に流すプレイリストと、チャットボックスの文字数制限を超えるメッセージの
+ページ分割も扱う。メッセージは chat_template のテンプレートとして公開時に解析しておく。
+"""
+from chat_template import compile_template
+
+
+# VRChat のチャットボックスの文字数制限
+CHATBOX_LIMIT = 144
+
+
+def paginate(message, limit=CHATBOX_LIMIT):
+    """メッセージを limit 文字以下のページに分ける (複数ページなら末尾に (n/m) を付ける)"""
+    if len(message) <= limit:
+        return (message,)
+    # ページ番号の分を空けて、なるべく空白・改行の位置で区切る
+    body_limit = limit - len(" (99/99)")
+    chunks = []
+    rest = message
+    while rest:
+        if len(rest) <= body_limit:
+            chunks.append(rest)
+            break
+        cut = max(rest.rfind(" ", 0, body_limit + 1), rest.rfind("\n", 0, body_limit + 1))
+        if cut <= 0:
+            cut = body_limit
+        chunks.append(rest[:cut].rstrip())
+        rest = rest[cut:].lstrip()
+    total = len(chunks)
+    return tuple(f"{chunk} ({i}/{total})" for i, chunk in enumerate(chunks, 1))
+
+
+class TokenBucket:
+    """rate 個/秒で補充され、最大 burst 個まで貯まるトークンバケット"""
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = None
+
+    def take(self, now):
+        """トークンを1つ使えれば True"""
+        if self.updated is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class ChatFeed:
+    """UIスレッドが公開するチャットの内容 (送信スレッドは読むだけ)"""
+
+    def __init__(self, message=None, playlist=()):
+        self.publish(message, playlist)
+
+    def publish(self, message, playlist=()):
+        """
+        :param message: 送信するメッセージ (チャット機能OFFの場合は None)
+        :param playlist: 順番に流すプリセット (空ならメッセージを送る)
+        """
+        # テンプレートの解析は公開する側 (UIスレッド) で済ませる
+        if message:
+            message = compile_template(message)
+        playlist = tuple(compile_template(text) for text in playlist if text)
+        # タプルを1回の代入で差し替えるので、読み手が途中の状態を見ることはない
+        self._snapshot = (message, playlist)
+
+    def snapshot(self):
+        return self._snapshot
+
+
+class ChatScheduler:
+    """チャットグループのティック毎に、送るべきページを1つ返す"""
+
+    def __init__(self, refresh=30.0, rotate_interval=30.0, rate=0.5, burst=3, limit=CHATBOX_LIMIT):
+        """
+        :param refresh: 変化が無いときの再送間隔 (秒、0以下で再送しない)
+        :param rotate_interval: プレイリストの次のプリセットに進む間隔 (秒)
+        :param rate: 送信できる数/秒 (トークンの補充速度)
+        :param burst: 続けて送信できる数
+        """
+        self.refresh = refresh
+        self.rotate_interval = rotate_interval
+        self.limit = limit
+        self.bucket = TokenBucket(rate, burst)
+        self.message = None
+        self.pages = ()
+        # 次に送るページ (全ページ送り終えたら len(pages))
+        self.page = 0
+        self.sent_at = None
+        self.playlist = ()
+        self.playlist_index = 0
+        self.rotated_at = None
+        # トークン切れで見送った回数
+        self.throttled = 0
+
+    def current(self, snapshot, now):
+        """プレイリストを進め、いま送るべきメッセージを返す"""
+        message, playlist = snapshot
+        if not playlist:
+            self.playlist = ()
+            return message
+        if playlist != self.playlist:
+            self.playlist = playlist
+            self.playlist_index = 0
+            self.rotated_at = now
+        elif now - self.rotated_at >= self.rotate_interval:
+            self.playlist_index = (self.playlist_index + 1) % len(playlist)
+            self.rotated_at = now
+        return playlist[self.playlist_index]
+
+    def poll(self, snapshot, now, values=None):
+        """
+        送るページを返す。送らない場合は None
+        :param values: テンプレートの置き換えに使う値 (置き換え名 → 値)
+        """
+        template = self.current(snapshot, now)
+        # 描画結果は値が変わらない限り同じ文字列なので、変化した場合だけ送信される
+        message = template.render(values or {}) if template else None
+        if not message:
+            # 空になったら、次に同じ内容が来たときも変化として扱う
+            self.message = None
+            return None
+        if message != self.message:
+            self.message = message
+            self.pages = paginate(message, self.limit)
+            self.page = 0
+        elif self.page >= len(self.pages):
+            # 全ページ送り終えている: 再送間隔が来たら先頭から送り直す
+            if self.refresh <= 0 or now - self.sent_at < self.refresh:
+                return None
+            self.page = 0
+        if not self.bucket.take(now):
+            # 同じページを次のティックで送り直す
+            self.throttled += 1
+            return None
+        page = self.pages[self.page]
+        self.page += 1
+        self.sent_at = now
+        return page
@@ -0,0 +1,68 @@
+"""
+チャットメッセージのテンプレート。
+
+{time} {gpu} {vram} {gpu_name} {cpu} {ram} {net} のような置き換えを、送信ループが計算済みの値で埋める。
+テンプレートは保存・選択されたときに1回だけ解析し、描画結果は参照している値の組で
+覚えておくので、値が変わらない限り同じ文字列を返す (= チャットの再送も起きない)。
+"""
+from functools import lru_cache
+from string import Formatter
+
+# 使える置き換え
+FIELDS = ("time", "gpu", "vram", "gpu_name", "cpu", "ram", "net")
+
+
+class ChatTemplate:
+    """解析済みのテンプレート"""
+    __slots__ = ("text", "fields", "parts", "_key", "_rendered")
+
+    def __init__(self, text):
+        self.text = text
+        fields = []
+        parts = []
+        try:
+            parsed = list(Formatter().parse(text))
+        except ValueError:
+            # 括弧の対応が取れていなければ、そのままの文字列として扱う
+            parsed = [(text, None, None, None)]
+        for literal, field, spec, conversion in parsed:
+            if field is not None and field not in FIELDS:
+                # 知らない置き換えは書かれたまま残す
+                literal += "{" + field + ("!" + conversion if conversion else "") + (":" + spec if spec else "") + "}"
+                field = None
+            if field is None:
+                if parts and parts[-1][1] is None:
+                    parts[-1] = (parts[-1][0] + literal, None, "")
+                else:
+                    parts.append((literal, None, ""))
+                continue
+            if field not in fields:
+                fields.append(field)
+            parts.append((literal, fields.index(field), spec or ""))
+        # (前に付く文字列, 値の位置 or None, 書式)
+        self.parts = tuple(parts)
+        self.fields = tuple(fields)
+        self._key = None
+        self._rendered = "".join(literal for literal, _, _ in parts) if not fields else None
+
+    def render(self, values):
+        """values (置き換え名 → 値) で埋めた文字列を返す"""
+        if not self.fields:
+            return self._rendered
+        key = tuple(values.get(field) for field in self.fields)
+        if key == self._key:
+            return self._rendered
+        out = []
+        for literal, i, spec in self.parts:
+            out.append(literal)
+            if i is not None and key[i] is not None:
+                out.append(format(key[i], spec))
+        self._key = key
+        self._rendered = "".join(out)
+        return self._rendered
+
+
+@lru_cache(maxsize=256)
+def compile_template(text):
+    """同じテキストは解析し直さず、同じ ChatTemplate を返す"""
+    return ChatTemplate(text)
@@ -0,0 +1,145 @@
+"""
+JSON設定ファイルの保存と監視。
+
+保存は呼び出し元のスレッドでは JSON 文字列にするだけで、書き込みは専用スレッドが
+最後の保存から少し待ってまとめて1回だけ行う (連続クリックでも書き込みは1回)。
+書き込みは一時ファイルに書いてから置き換えるので、途中で落ちても元のファイルは壊れない。
+ファイルの更新日時とサイズを覚えておき、外から書き換えられたら読み直せる。
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import suppress
+
+
+def write_text_atomic(path, text):
+    """同じフォルダの一時ファイルに書いてから置き換える"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        with suppress(OSError):
+            os.unlink(tmp_path)
+        raise
+
+
+def dump_json(value):
+    return json.dumps(value, ensure_ascii=False, indent=2)
+
+
+def read_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class JsonStore:
+    """JSONファイル1つ分の遅延書き込みと変更監視"""
+
+    def __init__(self, path, loader=read_json, delay=0.5, logger=None):
+        """
+        :param loader: loader(path) でファイルを読んで値を返す関数
+        :param delay: 最後の save() から書き込むまでの待ち時間 (秒)
+        """
+        self.path = path
+        self.loader = loader
+        self.delay = delay
+        self.logger = logger
+        self.writes = 0
+        self._cond = threading.Condition()
+        # 書き込み待ちの文字列と、書き込む時刻
+        self._pending = None
+        self._due = 0.0
+        self._writing = False
+        self._closed = False
+        # 最後に読み書きしたときのファイルの (更新日時, サイズ)
+        self._known = self._stat()
+        self._thread = threading.Thread(target=self._run, name=f"store-{os.path.basename(path)}", daemon=True)
+        self._thread.start()
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        """ファイルを読んで値を返す"""
+        with self._cond:
+            self._known = self._stat()
+        return self.loader(self.path)
+
+    def save(self, value):
+        """値を保存する (書き込みは後でまとめて行う)"""
+        # 呼び出し元が後で値を書き換えても影響しないよう、ここで文字列にしておく
+        text = dump_json(value)
+        with self._cond:
+            self._pending = text
+            self._due = time.monotonic() + self.delay
+            self._cond.notify()
+
+    def check(self):
+        """ファイルが外から書き換えられていれば読み直した値を返す (変わっていなければ None)"""
+        with self._cond:
+            if self._writing:
+                return None
+            current = self._stat()
+            if current is None or current == self._known:
+                return None
+            self._known = current
+            # 外での変更を優先し、まだ書いていない内容は捨てる
+            self._pending = None
+        try:
+            return self.loader(self.path)
+        except (OSError, ValueError) as e:
+            # 編集途中の壊れたJSONなどは無視して、次の変更を待つ
+            self._log(f"Error reloading {self.path}: {e}")
+            return None
+
+    def _run(self):
+        cond = self._cond
+        while True:
+            with cond:
+                while True:
+                    if self._pending is None:
+                        if self._closed:
+                            return
+                        cond.wait()
+                        continue
+                    delay = self._due - time.monotonic()
+                    if delay > 0 and not self._closed:
+                        cond.wait(delay)
+                        continue
+                    break
+                text, self._pending = self._pending, None
+                self._writing = True
+            try:
+                write_text_atomic(self.path, text)
+                self.writes += 1
+            except OSError as e:
+                self._log(f"Error saving {self.path}: {e}")
+            with cond:
+                self._known = self._stat()
+                self._writing = False
+                cond.notify_all()
+
+    def close(self):
+        """書き込み待ちの内容を書いてからスレッドを止める"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def _log(self, message):
+        if self.logger is not None:
+            self.logger.info(message)
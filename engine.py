@@ -0,0 +1,500 @@
+"""
+asyncio で動く送信エンジン。
+
+プロセスに1つだけ存在し、専用スレッドの asyncio ループ上で送信タスクを1つだけ動かす。
+Start を何度押しても送信ループが二重に動くことはなく、Stop は待ち時間中でも即座に効く。
+GPUの読み取りはブロックするのでエグゼキュータに逃がす。
+"""
+import asyncio
+import logging
+from logging import DEBUG
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from datetime import datetime
+
+from avatar_watch import DEFAULT_OSC_DIR, AvatarWatcher
+from chat_scheduler import ChatScheduler
+from gpu_providers import GPUProviderError
+from gpu_sampler import GPUSampler
+from metrics import Metrics, MetricsServer
+from osc_sender import DatagramTable, Destination, OSCDatagramSender, encode_message
+from param_map import compile_plan, default_mappings
+from param_state import ParamStateTable
+from scheduler import AdaptiveClock, DeadlineScheduler, IntervalClock, MinuteAlignedClock
+from system_sources import KINDS, SourceError, open_source
+
+
+class SendEngine:
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, gpu_provider=None, gpu_vendor=None, logger=None, chat_feed=None, on_gpu_error=None):
+        """
+        :param gpu_provider: 開いた状態の GPUProvider (無い場合は None)
+        :param chat_feed: UIスレッドがチャットの内容を公開する ChatFeed (チャットを送らない場合は None)
+        :param on_gpu_error: GPUの読み取りに失敗したときに呼ばれる関数
+        """
+        with SendEngine._instance_lock:
+            if SendEngine._instance is not None:
+                raise RuntimeError("SendEngine is already created in this process")
+            SendEngine._instance = self
+
+        self.gpu_provider = gpu_provider
+        self.gpu_vendor = gpu_vendor
+        self.logger = logger or logging.getLogger(__name__)
+        self.chat_feed = chat_feed
+        self.on_gpu_error = on_gpu_error
+        # 送信するパラメータ (paramMap の割り当てで start() 時に決まる。最初は従来の8つ)
+        self.params = compile_plan(default_mappings({})).params
+        # 全パラメータ × 0〜9 のデータグラムを事前にエンコード
+        self.param_table = DatagramTable(self.params)
+        self._param_ranges = None
+        self.client = None
+        # バックグラウンドのGPUサンプラ (送信中だけ動かす)
+        self.gpu_sampler = None
+        # 直近に読んだGPU毎の (GPU使用率%, VRAM使用率%) (gpu_provider.indices と同じ順)
+        self.gpu_devices = ()
+        # 直近に読んだVRAM使用量 (MB、プロバイダが返さなければ None)
+        self.gpu_vram_used = None
+        # 送信内容を記録する SessionRecorder (記録しない場合は None、ループ上でだけ書く)
+        self.recorder = None
+        self._gpu_warned = False
+        self.tick_count = self.param_count = self.chat_count = 0
+        # 計測 (カウンタはエンジンの生存期間中ずっと積み上げる)
+        self.metrics = Metrics(self.params)
+        self.metrics.destination_stats = self.stats
+        self.metrics_server = None
+        self._running = False
+        self._task = None
+        # start() 毎に増やす番号と、送信タスクを開始したときの番号
+        # (古い stop() が後から開始した送信を止めないようにする)
+        self._generation = 0
+        self._task_generation = 0
+
+        # 送信ループ専用の asyncio ループとスレッド (プロセスで1つ)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="send-engine", daemon=True)
+        self._thread.start()
+        # GPUの読み取り用 (ハンドルを1スレッドからだけ触る)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gpu-read")
+
+    @property
+    def running(self):
+        return self._running
+
+    def start(self, config):
+        """
+        送信を開始する。既に動いている場合は何もせず False を返す。
+        :param config: {"destinations", "bundle", "rates", "keepalive", "minSendGap", "paramRates", "logSummaryInterval", "chat", "gpuSampling", "gpuParams", "systemSources", "avatarWatch", "encoding", "paramMap"}
+        """
+        if self._running:
+            self.console("Engine is already running")
+            return False
+        # 送信先の名前解決はここで行い、失敗したら呼び出し元に例外を返す
+        destinations = [Destination.from_config(d) for d in config["destinations"]]
+        self._generation += 1
+        self._running = True
+        asyncio.run_coroutine_threadsafe(self._spawn(config, destinations, self._generation), self._loop).result()
+        return True
+
+    def reconfigure(self, config):
+        """送信中なら新しい設定で送信し直す。止まっている場合は何もせず False を返す"""
+        if not self._running:
+            return False
+        self.stop(wait=True)
+        return self.start(config)
+
+    def stop(self, wait=False, timeout=2.0):
+        """送信を停止する。wait=True なら停止完了まで待つ"""
+        self._running = False
+        future = asyncio.run_coroutine_threadsafe(self.shutdown(self._generation), self._loop)
+        if wait:
+            future.result(timeout)
+        return future
+
+    async def shutdown(self, generation=None):
+        """
+        送信タスクをキャンセルし、終わるまで待つ
+        :param generation: stop() を呼んだ時点の番号 (その後に start() した送信は止めない。None なら全部止める)
+        """
+        if generation is None or generation == self._generation:
+            self._running = False
+        elif self._task_generation > generation:
+            # stop() の後に start() で開始したタスクは止めない
+            return
+        task, self._task = self._task, None
+        if task is not None and not task.done():
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+
+    def serve_metrics(self, port):
+        """計測値を http://127.0.0.1:port/metrics で公開する"""
+        if self.metrics_server is None:
+            self.metrics_server = MetricsServer(self.metrics, port)
+            self.console(f"Metrics endpoint: http://127.0.0.1:{self.metrics_server.port}/metrics")
+        return self.metrics_server
+
+    def close(self):
+        """エンジンを破棄する (ループとスレッドも止める)"""
+        if self._loop.is_closed():
+            return
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+            self.metrics_server = None
+        self.stop(wait=True)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._executor.shutdown(wait=False)
+        with SendEngine._instance_lock:
+            if SendEngine._instance is self:
+                SendEngine._instance = None
+
+    async def _spawn(self, config, destinations, generation):
+        self._task = asyncio.get_running_loop().create_task(self.send_messages(config, destinations))
+        self._task_generation = generation
+        self._task.add_done_callback(self._on_task_done)
+
+    def _on_task_done(self, task):
+        # shutdown() で止めた古いタスクの完了通知は、次に開始したタスクの状態に影響させない
+        if task is self._task:
+            self._task = None
+            self._running = False
+        if not task.cancelled() and task.exception() is not None:
+            self.console(f"Engine error: {task.exception()!r}")
+
+    def open_client(self, destinations, bundle):
+        """
+        OSC送信用のノンブロッキングUDPソケットを1つ開き、全送信先 (解決済みの Destination) で共有する。
+        asyncio のトランスポートは送信エラーを握りつぶして送信済みに見せるので使わない
+        (ノンブロッキングなのでループ上から直接送っても待たされない)。
+        記録中は実際に送るデータグラム (バンドルモードならバンドル) を記録する。
+        """
+        recorder = self.recorder
+        return OSCDatagramSender(destinations, bundle=bundle, on_send=recorder.osc if recorder is not None else None)
+
+    def stats(self):
+        """送信先毎の送信カウンタ (送信していない場合は空)"""
+        client = self.client
+        return client.stats() if client is not None else []
+
+    def use_params(self, params, floats=(), ranges=None):
+        """送信するパラメータを差し替える (変わった場合だけ送信表を作り直す)"""
+        floats = frozenset(floats)
+        if params == self.params and floats == self.param_table.floats and ranges == self._param_ranges:
+            return
+        self.params = params
+        self._param_ranges = ranges
+        self.param_table = DatagramTable(params, floats=floats, ranges=ranges)
+        # 計測値は作り直さず、パラメータ毎の配列だけを差し替える
+        self.metrics.set_params(params)
+
+    def open_sources(self, kinds, config):
+        """CPU・RAM・ネットワークのテレメトリを開き、(種類, 開いたソース) の列を返す"""
+        sources = []
+        for kind in kinds:
+            try:
+                source = open_source(kind, config.get("netUnitMbps", 1.0), config.get("netInterfaces"))
+            except SourceError as e:
+                self.console(f"System source error ({kind}): {e}")
+                continue
+            sources.append((kind, source))
+        return sources
+
+    def open_avatar_watcher(self, config, scheduler):
+        """アバターの切り替えの監視を始める (無効・ポートが使えない場合は None)"""
+        if not config.get("enabled"):
+            return None
+        loop = asyncio.get_running_loop()
+        scheduler.enable_wake()
+        try:
+            watcher = AvatarWatcher(
+                port=config.get("port", 9001),
+                osc_dir=config.get("oscDir") or DEFAULT_OSC_DIR,
+                # 切り替わったら次の締め切りを待たずに送り直す
+                on_change=lambda: loop.call_soon_threadsafe(scheduler.wake),
+                logger=self.logger,
+            )
+        except OSError as e:
+            self.console(f"Avatar watch error: {e}")
+            return None
+        self.console(f"Watching avatar changes on port {watcher.port}")
+        return watcher
+
+    def apply_avatar(self, state, watcher):
+        """今のアバターに無いパラメータを止め、残りを全部送り直させる"""
+        names = state.names
+        for i in range(len(names)):
+            state.set_enabled(i, watcher.accepts(self.params[names[i]]))
+        state.invalidate()
+        enabled = sum(state.enabled)
+        if not enabled:
+            self.console("Avatar has no watch parameters, pausing parameter sends")
+        elif enabled < len(names):
+            self.console(f"Avatar accepts {enabled}/{len(names)} watch parameters")
+
+    async def send_messages(self, config, destinations):
+        rates = config["rates"]
+        # 割り当て (省略時は encoding・gpuParams・systemSources から従来どおりに作る) を送信計画にする
+        mappings = config.get("paramMap")
+        if mappings is None:
+            mappings = default_mappings(config)
+        indices = self.gpu_provider.indices if self.gpu_provider is not None else ()
+        plan = compile_plan(mappings, indices, self.console)
+        self.use_params(plan.params, plan.floats, plan.ranges or None)
+        sources = self.open_sources([kind for kind in plan.sources if kind in KINDS], config)
+        # パラメータ毎の現在値・送信状態
+        state = ParamStateTable(
+            self.params,
+            keepalive=config.get("keepalive", 10.0),
+            min_gap=config.get("minSendGap", 0.0),
+            overrides=config.get("paramRates"),
+        )
+        groups = plan.bind(state.index)
+        clock_plan, gpu_plan, system_plan = groups["clock"], groups["gpu"], groups["system"]
+        device_sources = plan.devices
+        total_vram = self.gpu_provider.total_vram if self.gpu_provider is not None else None
+        # source 毎の最新の値
+        values = {}
+        prev_gpu_sample = None
+        gpu = vram = 0
+        # チャットのテンプレートに埋める値 (各グループで計算した値をそのまま使う)
+        chat_values = {
+            "time": "",
+            "gpu": 0,
+            "vram": 0,
+            "gpu_name": self.gpu_provider.name if self.gpu_provider is not None else "",
+            "cpu": 0,
+            "ram": 0,
+            "net": 0,
+        }
+        self._gpu_warned = False
+
+        # INFOには一定間隔で要約だけを出す (毎ティックの詳細はDEBUG)
+        summary_interval = config.get("logSummaryInterval", 60.0)
+        summary_at = time.monotonic() + summary_interval
+        self.tick_count = self.param_count = self.chat_count = 0
+        max_lateness = 0.0
+        metrics = self.metrics
+        stages = metrics.stages
+        perf_counter = time.perf_counter
+
+        self.console(f"GPU Vendor detected: {self.gpu_vendor}")
+        # 開いたものはこのタスクの終わりに閉じる (self.* は次に開始したタスクのものになっている場合がある)
+        client = self.client = self.open_client(destinations, config.get("bundle", False))
+        # GPUは別スレッドで細かくサンプリングし、まとめた値を読む (rate が 0 ならティック毎に直接読む)
+        sampling = config.get("gpuSampling", {})
+        sampler = None
+        if self.gpu_provider is not None and sampling.get("rate", 0) > 0:
+            sampler = GPUSampler.from_config(self.gpu_provider, sampling).start()
+        self.gpu_sampler = sampler
+
+        # グループ毎の締め切り
+        clock_group = MinuteAlignedClock("clock", rates["clock"])
+        gpu_group = AdaptiveClock("gpu", rates["gpuMin"], rates["gpuMax"])
+        chat_group = IntervalClock("chat", rates["chat"])
+        system_group = IntervalClock("system", rates.get("system", 1.0))
+        scheduler = DeadlineScheduler([clock_group, gpu_group, chat_group, system_group])
+        chat_config = config.get("chat", {})
+        chat = ChatScheduler(
+            refresh=chat_config.get("refresh", 30.0),
+            rotate_interval=chat_config.get("rotateInterval", 30.0),
+            rate=chat_config.get("tokenRate", 0.5),
+            burst=chat_config.get("tokenBurst", 3),
+        )
+        # アバターが受け付けるパラメータだけを送る
+        watcher = self.open_avatar_watcher(config.get("avatarWatch", {}), scheduler)
+        avatar_generation = 0
+        recorder = self.recorder
+
+        try:
+            while True:
+                due = await scheduler.async_wait()
+                tick_start = perf_counter()
+                stages["lateness"].observe(scheduler.lateness)
+                debug = self.logger.isEnabledFor(DEBUG)
+                if watcher is not None and watcher.generation != avatar_generation:
+                    avatar_generation = watcher.generation
+                    self.apply_avatar(state, watcher)
+
+                if clock_group in due:
+                    now = datetime.now()
+                    values["hour"], values["minute"], values["second"] = now.hour, now.minute, now.second
+                    values["day"], values["month"], values["year"] = now.day, now.month, now.year
+                    values["weekday"] = now.weekday()
+                    for source, transform, value_slot in clock_plan:
+                        state.set_value(value_slot, transform(values[source]))
+                    chat_values["time"] = f"{now.hour:02d}:{now.minute:02d}"
+                    if debug:
+                        self.logger.debug("Clock: %s (late %.1fms)", now.strftime('%Y-%m-%d %H:%M:%S'), scheduler.lateness * 1000)
+
+                if gpu_group in due:
+                    read_start = perf_counter()
+                    try:
+                        gpu, vram = await self.get_gpu_usage_v2()
+                    except GPUProviderError as e:
+                        metrics.gpu_read_errors += 1
+                        self.console(f"GPU read error: {e}")
+                        if self.on_gpu_error is not None:
+                            self.on_gpu_error(e)
+                        return
+                    # エグゼキュータ待ちも含めた読み取り時間
+                    gpu_read_end = perf_counter()
+                    if recorder is not None:
+                        recorder.gpu(gpu, vram, self.gpu_vram_used)
+                    stages["gpu_read"].observe(gpu_read_end - read_start)
+                    values["gpu"], values["vram"] = gpu, vram
+                    # 使用量はプロバイダが読んだ MB をそのまま使う (返さないプロバイダだけ使用率から見積もる)
+                    vram_used = self.gpu_vram_used
+                    if vram_used is None:
+                        vram_used = vram * total_vram // 100 if total_vram else 0
+                    values["vram_mb"] = vram_used
+                    # GPU毎の値
+                    devices = self.gpu_devices
+                    for position, kind, source in device_sources:
+                        values[source] = devices[position][kind]
+                    for source, transform, value_slot in gpu_plan:
+                        state.set_value(value_slot, transform(values[source]))
+                    gpu = min(gpu, 99)
+                    vram = min(vram, 99)
+                    if debug:
+                        self.logger.debug("gpu:%d%% vram:%d%% (vendor:%s)", gpu, vram, self.gpu_vendor)
+                    changed = (gpu, vram) != prev_gpu_sample
+                    prev_gpu_sample = (gpu, vram)
+                    chat_values["gpu"] = gpu
+                    chat_values["vram"] = vram
+                    # 変化していれば速く、落ち着いていれば遅くサンプリング
+                    gpu_group.feed(changed)
+
+                if system_group in due:
+                    # /proc の読み直しは数十マイクロ秒なのでループ上で直接読む
+                    for kind, source in sources:
+                        try:
+                            values[kind] = source.read()
+                        except SourceError as e:
+                            self.console(f"System source error ({kind}): {e}")
+                            continue
+                        chat_values[kind] = min(values[kind], 99)
+                    for source, transform, value_slot in system_plan:
+                        # 読めなかったソースは前回の値のまま
+                        if source in values:
+                            state.set_value(value_slot, transform(values[source]))
+
+                # 変化した・キープアライブ時刻が来たパラメータだけ送る
+                mono = time.monotonic()
+                encode_start = perf_counter()
+                self.send_params(state, mono, debug)
+                encode_end = perf_counter()
+                stages["encode"].observe(encode_end - encode_start)
+
+                # チャット送信処理
+                if chat_group in due and self.chat_feed is not None:
+                    self.send_chat_message(chat, mono, chat_values)
+                    chat_end = perf_counter()
+                    stages["chat"].observe(chat_end - encode_end)
+                    encode_end = chat_end
+
+                # バンドルモードなら1ティック分をまとめて送信
+                self.client.flush()
+                send_end = perf_counter()
+                stages["send"].observe(send_end - encode_end)
+
+                scheduler.reschedule(due)
+
+                # GPUの読み取り待ちはティックの処理時間に含めない
+                tick_time = send_end - tick_start
+                if gpu_group in due:
+                    tick_time -= gpu_read_end - read_start
+                stages["tick"].observe(tick_time)
+                metrics.ticks += 1
+                self.tick_count += 1
+                max_lateness = max(max_lateness, scheduler.lateness)
+                if mono >= summary_at:
+                    self.console(
+                        f"Summary: ticks={self.tick_count} params={self.param_count} chat={self.chat_count} "
+                        f"gpu={gpu}% vram={vram}% late_max={max_lateness * 1000:.1f}ms"
+                    )
+                    summary_at = mono + summary_interval
+                    self.tick_count = self.param_count = self.chat_count = 0
+                    max_lateness = 0.0
+        finally:
+            if watcher is not None:
+                watcher.close()
+            for _, source in sources:
+                source.close()
+            if sampler is not None:
+                sampler.close()
+                if self.gpu_sampler is sampler:
+                    self.gpu_sampler = None
+            client.close()
+
+    async def get_gpu_usage_v2(self):
+        sampler = self.gpu_sampler
+        if sampler is not None:
+            usage = sampler.read()
+            if usage is None:
+                # 最初のサンプルが出るまでだけ待つ
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(self._executor, sampler.wait_ready)
+                usage = sampler.read()
+            self.gpu_devices = sampler.devices()
+            self.gpu_vram_used = sampler.vram_used()
+            return usage
+        if self.gpu_provider is not None:
+            loop = asyncio.get_running_loop()
+            # 複数GPUでも1回で全GPUを読む
+            usage, self.gpu_devices, self.gpu_vram_used = await loop.run_in_executor(
+                self._executor, self.gpu_provider.read_all
+            )
+            return usage
+        if not self._gpu_warned:
+            # 毎回同じ警告を出さないよう、送信開始後の最初の1回だけ出す
+            if self.gpu_vendor == "INTEGRATED":
+                self.console("内蔵GPUを検出")
+            else:
+                self.console("警告: 対応していないGPUです。")
+            self.console("GPU使用率は0%として表示されます。")
+            self.console(f"gpu_vendor:{self.gpu_vendor}")
+            self._gpu_warned = True
+        return 0, 0
+
+    def send_params(self, state, now, debug=False):
+        names = state.names
+        metrics = self.metrics
+        due = state.due(now)
+        metrics.skipped_sends += len(names) - len(due)
+        for i in due:
+            param_name = names[i]
+            value = state.values[i]
+            datagram = self.param_table.get(param_name, value)
+            self.client.post(datagram, param_name)
+            state.mark_sent(i, now)
+            metrics.record_param(i, len(datagram))
+            self.param_count += 1
+            if debug:
+                self.logger.debug("Param: %s, Address:%s Value: %d", param_name, self.params[param_name], value)
+
+    def send_chat_message(self, chat, now, values=None):
+        """公開されたチャットの内容が変わった・再送時刻が来たときだけVRChatに送信する"""
+        try:
+            throttled = chat.throttled
+            message = chat.poll(self.chat_feed.snapshot(), now, values)
+            self.metrics.chat_throttled += chat.throttled - throttled
+            if message:
+                # VRChatのチャットボックスにメッセージを送信
+                datagram = encode_message("/chatbox/input", message, True, False)
+                self.client.post(datagram)
+                if self.recorder is not None:
+                    self.recorder.chat(message)
+                self.chat_count += 1
+                self.metrics.chat_packets += 1
+                self.logger.debug("Chat sent: %s", message)
+        except Exception as e:
+            error_msg = f"Chat send error: {str(e)}"
+            self.console(error_msg)
+
+    def console(self, value):
+        self.logger.info(value)
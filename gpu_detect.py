@@ -0,0 +1,161 @@
+"""
+GPUの検出。
+
+各プロバイダの初期化 (NVML / ADLX / sysfs / WMI) を並列に試し、タイムアウトまでに
+成功したものから優先順位の高いものを選ぶ。結果は settings.json の gpuCache に保存し、
+次回の起動ではキャッシュしたデバイスだけを開いて確かめる。
+キャッシュしたデバイスが見つからなくなったときだけ全部を試し直す。ただしキャッシュが
+優先順位の低いもの (内蔵GPU など) のときは、後から入ったドライバを拾えるように上位のプロバイダも試す。
+主GPUが決まったら、同じプロバイダで残りのGPUも開いてまとめて読めるようにする。
+"""
+import sys
+import threading
+from collections import namedtuple
+from concurrent.futures import Future, wait
+
+from gpu_providers import AUTO_ORDER, PROVIDERS, GPUProviderError, open_devices
+
+# 検出に使う名前の優先順位 (wmi は使用率を取れない内蔵GPUの名前だけ)
+PROBE_ORDER = AUTO_ORDER + ("wmi",)
+
+# provider: 開いた GPUProvider (内蔵GPU・未検出の場合は None)
+# cache: settings.json の gpuCache に保存する内容
+Detection = namedtuple("Detection", ("provider", "vendor", "name", "cache"))
+
+NOT_FOUND = Detection(None, None, None, None)
+
+
+class IntegratedGPU:
+    """WMIで名前だけ取れる内蔵GPU (使用率は取得しない)"""
+    vendor = "INTEGRATED"
+
+    def __init__(self, index=0):
+        self.index = index
+        self.name = None
+        self.total_vram = None
+        self.driver_version = None
+
+    def open(self):
+        if sys.platform != "win32":
+            raise GPUProviderError("WMI is only available on Windows")
+        try:
+            import wmi
+            gpus = wmi.WMI().Win32_VideoController()
+        except Exception as e:
+            raise GPUProviderError(f"WMI query failed: {e}")
+        if len(gpus) <= self.index:
+            raise GPUProviderError("No video controller found")
+        gpu = gpus[self.index]
+        self.name = gpu.Name
+        self.driver_version = getattr(gpu, "DriverVersion", None)
+        return self
+
+    def close(self):
+        pass
+
+
+def _open(key, index=0):
+    cls = IntegratedGPU if key == "wmi" else PROVIDERS[key]
+    return cls(index).open()
+
+
+def _result(key, device):
+    """開いたデバイスから Detection を作る"""
+    cache = {
+        "provider": key,
+        "vendor": device.vendor,
+        "index": device.index,
+        "name": device.name,
+        "totalVram": device.total_vram,
+        "driverVersion": device.driver_version,
+    }
+    provider = None if key == "wmi" else device
+    return Detection(provider, device.vendor, device.name, cache)
+
+
+def revalidate(cache, timeout=5.0):
+    """
+    キャッシュしたデバイスだけを開き、同じデバイスなら Detection を返す。
+    キャッシュより優先順位の高いプロバイダが開ければそちらを返す。
+    """
+    key = cache.get("provider")
+    if key not in PROBE_ORDER:
+        return None
+    higher = PROBE_ORDER[:PROBE_ORDER.index(key)]
+    if higher:
+        detection = probe_all(timeout, higher)
+        if detection is not NOT_FOUND:
+            return detection
+    try:
+        device = _open(key, cache.get("index", 0))
+    except Exception:
+        return None
+    if device.name != cache.get("name"):
+        device.close()
+        return None
+    return _result(key, device)
+
+
+def _probe(key):
+    """
+    デーモンスレッドで _open(key) を試し、結果の Future を返す
+    (固まった初期化があっても終了時に待たない)
+    """
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(_open(key))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name=f"gpu-probe-{key}", daemon=True).start()
+    return future
+
+
+def probe_all(timeout=5.0, order=PROBE_ORDER):
+    """全プロバイダを並列に試し、優先順位の一番高いものを返す"""
+    futures = {_probe(key): key for key in order}
+    done, not_done = wait(futures, timeout=timeout)
+    # タイムアウトした初期化は待たない (遅れて成功した場合は閉じる)
+    for future in not_done:
+        future.add_done_callback(lambda f: f.exception() is None and f.result().close())
+
+    opened = {}
+    for future in done:
+        if future.exception() is None:
+            opened[futures[future]] = future.result()
+
+    best = next((key for key in order if key in opened), None)
+    for key, device in opened.items():
+        if key != best:
+            device.close()
+    if best is None:
+        return NOT_FOUND
+    return _result(best, opened[best])
+
+
+def detect_gpu(provider_name="auto", cache=None, timeout=5.0, devices="all", aggregate="max"):
+    """
+    GPUを検出して Detection を返す。
+    provider_name が auto 以外のときはそのプロバイダだけを開く (キャッシュは使わない)。
+    :param devices: 一緒に読むGPU ("all" またはインデックスのリスト)
+    :param aggregate: 複数GPUのまとめ方 (max / sum / avg)
+    """
+    if provider_name != "auto":
+        if provider_name not in PROVIDERS:
+            raise GPUProviderError(f"Unknown GPU provider: {provider_name}")
+        detection = _result(provider_name, _open(provider_name))
+    else:
+        detection = revalidate(cache, timeout) if cache else None
+        if detection is None:
+            detection = probe_all(timeout)
+    return with_devices(detection, devices, aggregate)
+
+
+def with_devices(detection, devices="all", aggregate="max"):
+    """主GPUと同じプロバイダで残りのGPUも開く (キャッシュは主GPUのまま)"""
+    if detection.provider is None:
+        return detection
+    provider = open_devices(detection.cache["provider"], detection.provider, devices, aggregate)
+    return detection._replace(provider=provider, name=provider.name)
@@ -0,0 +1,406 @@
+"""
+GPUテレメトリのプロバイダ層。
+
+各プロバイダは open() でライブラリとデバイスハンドルを一度だけ確保し、
+GPU名や総VRAMなどの静的な値をキャッシュする。
+毎ティックの read() では使用率などの変化する値だけを読む。
+"""
+import os
+import sys
+from itertools import cycle
+
+
+class GPUProviderError(Exception):
+    """GPUプロバイダの初期化・読み取りエラー"""
+
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+
+class GPULibraryNotFoundError(GPUProviderError):
+    """GPUドライバのライブラリ (nvml.dll など) が見つからない"""
+
+
+class GPUProvider:
+    """GPUプロバイダの基底クラス"""
+    vendor = None
+
+    def __init__(self, index=0):
+        self.index = index
+        self.name = None
+        self.total_vram = None  # MB
+        # 最後の read() で読んだVRAM使用量 (MB、分からなければ None)
+        self.vram_used = None
+        self.driver_version = None
+        self.opened = False
+
+    def open(self):
+        """ライブラリとデバイスハンドルを確保し、静的な値をキャッシュする"""
+        self.opened = True
+        return self
+
+    def read(self):
+        """(GPU使用率%, VRAM使用率%) を返す"""
+        raise NotImplementedError
+
+    def read_all(self):
+        """まとめた (GPU使用率%, VRAM使用率%)、GPU毎の値のタプル、VRAM使用量 (MB or None) を返す"""
+        usage = self.read()
+        return usage, (usage,), self.vram_used
+
+    @property
+    def indices(self):
+        """読んでいるGPUのインデックス (read_all() のGPU毎の値と同じ順)"""
+        return (self.index,)
+
+    def close(self):
+        """確保したハンドルを解放する"""
+        self.opened = False
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class NvmlProvider(GPUProvider):
+    """NVIDIA (NVML)"""
+    vendor = "NVIDIA"
+
+    def open(self):
+        try:
+            import pynvml
+        except ImportError as e:
+            raise GPUProviderError(f"pynvml is not available: {e}")
+        self._nvml = pynvml
+        try:
+            pynvml.nvmlInit()
+        except pynvml.NVMLError_LibraryNotFound as e:
+            raise GPULibraryNotFoundError(str(e))
+        except pynvml.NVMLError as e:
+            raise self._error(e)
+        try:
+            if pynvml.nvmlDeviceGetCount() <= self.index:
+                raise GPUProviderError(f"NVIDIA GPU index {self.index} not found")
+            self._handle = pynvml.nvmlDeviceGetHandleByIndex(self.index)
+            self.name = self._decode(pynvml.nvmlDeviceGetName(self._handle))
+            self.total_vram = pynvml.nvmlDeviceGetMemoryInfo(self._handle).total // (1024 * 1024)
+            self.driver_version = self._decode(pynvml.nvmlSystemGetDriverVersion())
+        except pynvml.NVMLError as e:
+            pynvml.nvmlShutdown()
+            raise self._error(e)
+        except GPUProviderError:
+            pynvml.nvmlShutdown()
+            raise
+        return super().open()
+
+    def read(self):
+        nvml = self._nvml
+        try:
+            utilization = nvml.nvmlDeviceGetUtilizationRates(self._handle)
+            memory_info = nvml.nvmlDeviceGetMemoryInfo(self._handle)
+        except nvml.NVMLError_LibraryNotFound as e:
+            raise GPULibraryNotFoundError(str(e))
+        except nvml.NVMLError as e:
+            raise self._error(e)
+        self.vram_used = memory_info.used // (1024 * 1024)
+        return int(utilization.gpu), int(memory_info.used / memory_info.total * 100)
+
+    def close(self):
+        if self.opened:
+            self._nvml.nvmlShutdown()
+        super().close()
+
+    def _error(self, e):
+        error_code = e.args[0] if e.args else "Unknown"
+        try:
+            error_message = self._nvml.nvmlErrorString(error_code)
+        except Exception:
+            error_message = str(e)
+        return GPUProviderError(self._decode(error_message), code=error_code)
+
+    @staticmethod
+    def _decode(value):
+        return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+class AdlxProvider(GPUProvider):
+    """AMD Radeon (ADLX)"""
+    vendor = "RADEON"
+
+    def open(self):
+        try:
+            import ADLXPybind as ADLX  # ADLXPybind.pydをインポート
+        except ImportError as e:
+            raise GPUProviderError(f"ADLXPybind is not available: {e}")
+        self._helper = ADLX.ADLXHelper()
+        if self._helper.Initialize() != ADLX.ADLX_RESULT.ADLX_OK:
+            raise GPUProviderError("Failed to initialize ADLXHelper")
+        try:
+            # System Services取得
+            system = self._helper.GetSystemServices()
+            if system is None:
+                raise GPUProviderError("Failed to get system services")
+
+            # Performance Monitoring Services取得
+            self._perf_monitoring = system.GetPerformanceMonitoringServices()
+            if self._perf_monitoring is None:
+                raise GPUProviderError("Failed to get performance monitoring services")
+
+            # GPUリスト取得
+            gpu_list = system.GetGPUs()
+            if gpu_list is None or len(gpu_list) <= self.index:
+                raise GPUProviderError("Failed to get GPU list")
+            self._gpu = gpu_list[self.index]
+
+            # GPUUsageとVRAMUsageがサポートされているか確認
+            metrics_support = self._perf_monitoring.GetSupportedGPUMetrics(self._gpu)
+            if metrics_support is None or not (metrics_support.IsSupportedGPUUsage() and metrics_support.IsSupportedGPUVRAM()):
+                raise GPUProviderError("GPU usage / VRAM metrics are not supported")
+
+            self.name = self._gpu.Name()
+            self.total_vram = self._gpu.TotalVRAM()  # MB
+        except Exception:
+            self._helper.Terminate()
+            raise
+        return super().open()
+
+    def read(self):
+        current_metrics = self._perf_monitoring.GetCurrentGPUMetrics(self._gpu)
+        if current_metrics is None:
+            raise GPUProviderError("Failed to get current GPU metrics")
+        gpu_usage = current_metrics.GPUUsage()  # GPU利用率 (%)
+        vram_usage = current_metrics.GPUVRAM()  # VRAM使用量 (MB)
+        self.vram_used = int(vram_usage)
+        return int(gpu_usage), int(vram_usage / self.total_vram * 100)
+
+    def close(self):
+        if self.opened:
+            self._helper.Terminate()
+        super().close()
+
+
+class SysfsProvider(GPUProvider):
+    """Linux (sysfs の amdgpu / xe 系ドライバ)"""
+    DRM_DIR = "/sys/class/drm"
+    PCI_VENDORS = {
+        0x1002: "RADEON",
+        0x10de: "NVIDIA",
+        0x8086: "INTEGRATED",
+    }
+
+    def __init__(self, index=0, drm_dir=None):
+        super().__init__(index)
+        self.drm_dir = drm_dir or self.DRM_DIR
+        self.vendor = "SYSFS"
+
+    @classmethod
+    def list_devices(cls, drm_dir=None):
+        """gpu_busy_percent を持つ cardN/device ディレクトリを列挙する"""
+        drm_dir = drm_dir or cls.DRM_DIR
+        try:
+            cards = sorted(
+                (name for name in os.listdir(drm_dir) if name.startswith("card") and name[4:].isdigit()),
+                key=lambda name: int(name[4:]),
+            )
+        except OSError:
+            return []
+        devices = []
+        for card in cards:
+            device_dir = os.path.join(drm_dir, card, "device")
+            if os.path.exists(os.path.join(device_dir, "gpu_busy_percent")):
+                devices.append(device_dir)
+        return devices
+
+    def open(self):
+        if not sys.platform.startswith("linux"):
+            raise GPUProviderError("sysfs provider is only available on Linux")
+        devices = self.list_devices(self.drm_dir)
+        if len(devices) <= self.index:
+            raise GPUProviderError(f"sysfs GPU index {self.index} not found")
+        device_dir = devices[self.index]
+
+        vendor_id = self._read_int(os.path.join(device_dir, "vendor"), base=16)
+        self.vendor = self.PCI_VENDORS.get(vendor_id, "SYSFS")
+        self.name = self._read_text(os.path.join(device_dir, "product_name")) or self._pci_name(device_dir)
+        total = self._read_int(os.path.join(device_dir, "mem_info_vram_total"))
+        self.total_vram = total // (1024 * 1024) if total else None
+
+        # 変化する値のファイルは開いたままにして毎回先頭から読み直す
+        self._busy_file = open(os.path.join(device_dir, "gpu_busy_percent"), "rb", buffering=0)
+        vram_used_path = os.path.join(device_dir, "mem_info_vram_used")
+        self._vram_used_file = open(vram_used_path, "rb", buffering=0) if total and os.path.exists(vram_used_path) else None
+        self._total_bytes = total
+        return super().open()
+
+    def read(self):
+        try:
+            gpu = int(os.pread(self._busy_file.fileno(), 32, 0))
+            vram = 0
+            if self._vram_used_file is not None:
+                used = int(os.pread(self._vram_used_file.fileno(), 32, 0))
+                vram = int(used / self._total_bytes * 100)
+                self.vram_used = used // (1024 * 1024)
+        except (OSError, ValueError) as e:
+            raise GPUProviderError(f"Failed to read sysfs GPU metrics: {e}")
+        return gpu, vram
+
+    def close(self):
+        if self.opened:
+            self._busy_file.close()
+            if self._vram_used_file is not None:
+                self._vram_used_file.close()
+        super().close()
+
+    @staticmethod
+    def _read_text(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    @classmethod
+    def _read_int(cls, path, base=10):
+        text = cls._read_text(path)
+        try:
+            return int(text, base) if text else None
+        except ValueError:
+            return None
+
+    @classmethod
+    def _pci_name(cls, device_dir):
+        uevent = cls._read_text(os.path.join(device_dir, "uevent")) or ""
+        for line in uevent.splitlines():
+            if line.startswith("PCI_ID="):
+                return f"PCI {line[len('PCI_ID='):]}"
+        return os.path.basename(os.path.dirname(device_dir))
+
+
+class FakeProvider(GPUProvider):
+    """GPUの無い環境でのテスト用プロバイダ"""
+    vendor = "FAKE"
+
+    def __init__(self, index=0, samples=None, name="Fake GPU", total_vram=8192, count=1):
+        super().__init__(index)
+        # samples: (GPU使用率%, VRAM使用率%) の列。省略時は三角波
+        self.samples = samples
+        # 存在することにするGPUの数
+        self.count = count
+        self.fake_name = name
+        self.fake_total_vram = total_vram
+
+    def open(self):
+        if self.index >= self.count:
+            raise GPUProviderError(f"Fake GPU index {self.index} not found")
+        self.name = self.fake_name
+        self.total_vram = self.fake_total_vram
+        self.driver_version = "fake"
+        samples = self.samples
+        if samples is None:
+            wave = list(range(0, 100, 7)) + list(range(98, 0, -7))
+            samples = [(g, (g // 2) + 30) for g in wave]
+        self._samples = cycle(samples)
+        return super().open()
+
+    def read(self):
+        gpu, vram = next(self._samples)
+        self.vram_used = vram * self.total_vram // 100
+        return gpu, vram
+
+
+# 複数GPUのまとめ方 (settings.json の gpuAggregate)
+AGGREGATES = ("max", "sum", "avg")
+
+
+class MultiGPUProvider(GPUProvider):
+    """同じプロバイダで開いた複数のGPUを1回でまとめて読む"""
+
+    def __init__(self, providers, aggregate="max"):
+        """
+        :param providers: 開いた状態の GPUProvider のリスト (先頭が主GPU)
+        :param aggregate: max / sum / avg
+        """
+        if aggregate not in AGGREGATES:
+            raise GPUProviderError(f"Unknown GPU aggregate: {aggregate}")
+        super().__init__(providers[0].index)
+        self.providers = tuple(providers)
+        self.aggregate = aggregate
+        self.vendor = providers[0].vendor
+
+    def open(self):
+        # 各GPUは開いた状態で受け取るので、まとめた静的な値だけを作る
+        self.name = " / ".join(p.name for p in self.providers)
+        totals = [p.total_vram for p in self.providers]
+        self.total_vram = sum(totals) if all(totals) else None
+        self.driver_version = self.providers[0].driver_version
+        return super().open()
+
+    @property
+    def indices(self):
+        return tuple(p.index for p in self.providers)
+
+    def read(self):
+        return self.read_all()[0]
+
+    def read_all(self):
+        readings = tuple(p.read() for p in self.providers)
+        count = len(readings)
+        if self.aggregate == "max":
+            usage = (max(g for g, _ in readings), max(v for _, v in readings))
+        elif self.aggregate == "avg":
+            usage = (sum(g for g, _ in readings) // count, sum(v for _, v in readings) // count)
+        else:
+            # sum: 使用率は合計、VRAMは全GPUの合計容量に対する使用率
+            if self.total_vram:
+                vram = sum(v * p.total_vram for (_, v), p in zip(readings, self.providers)) // self.total_vram
+            else:
+                vram = sum(v for _, v in readings) // count
+            usage = (sum(g for g, _ in readings), vram)
+        used = [p.vram_used for p in self.providers]
+        self.vram_used = sum(used) if None not in used else None
+        return usage, readings, self.vram_used
+
+    def close(self):
+        for provider in self.providers:
+            provider.close()
+        super().close()
+
+
+# settings.json の gpuProvider で指定できる名前
+PROVIDERS = {
+    "nvml": NvmlProvider,
+    "adlx": AdlxProvider,
+    "sysfs": SysfsProvider,
+    "fake": FakeProvider,
+}
+
+# auto のときに試す順番
+AUTO_ORDER = ("nvml", "adlx", "sysfs")
+
+# devices="all" のときに試すインデックスの上限
+MAX_DEVICES = 16
+
+
+def open_devices(name, first, devices="all", aggregate="max"):
+    """
+    first (開いた主GPU) と同じプロバイダで残りのGPUも開き、まとめて読めるプロバイダを返す。
+    GPUが1つだけなら first をそのまま返す。
+    :param devices: "all" またはインデックスのリスト
+    """
+    indices = range(MAX_DEVICES) if devices == "all" else devices
+    providers = [first]
+    for index in indices:
+        if index == first.index:
+            continue
+        try:
+            providers.append(PROVIDERS[name](index).open())
+        except GPUProviderError:
+            if devices == "all":
+                # インデックスは詰まっているので、見つからなくなったら終わり
+                break
+    if len(providers) == 1:
+        return first
+    return MultiGPUProvider(providers, aggregate).open()
@@ -0,0 +1,182 @@
+"""
+GPUのバックグラウンドサンプリング。
+
+専用スレッドで一定のレート (例: 10 Hz) で GPUProvider.read() を呼び、配列のリングバッファに溜める。
+溜めた値を EMA・窓内の最大値・パーセンタイルのいずれかでまとめ、ヒステリシス幅を超えて
+動いたときだけ公開値を更新する。送信ループは公開値を読むだけなので、1桁目がばたつかない。
+複数GPUの場合は1回の read_all() で全GPUを読み、まとめた値とGPU毎の値の両方を公開する。
+"""
+import threading
+import time
+from array import array
+from math import ceil
+
+# まとめ方
+MODES = ("ema", "max", "percentile")
+
+
+class RingBuffer:
+    """固定長の float 配列に上書きしながら溜める"""
+    __slots__ = ("data", "size", "pos", "count", "_scratch")
+
+    def __init__(self, size):
+        self.size = max(int(size), 1)
+        self.data = array("d", [0.0] * self.size)
+        self.pos = 0
+        self.count = 0
+        # パーセンタイル計算用の作業領域 (毎回確保しない)
+        self._scratch = []
+
+    def append(self, value):
+        self.data[self.pos] = value
+        self.pos = (self.pos + 1) % self.size
+        if self.count < self.size:
+            self.count += 1
+
+    def max(self):
+        if self.count < self.size:
+            return max(self.data[:self.count], default=0.0)
+        return max(self.data)
+
+    def percentile(self, q):
+        if not self.count:
+            return 0.0
+        scratch = self._scratch
+        scratch[:] = self.data[:self.count] if self.count < self.size else self.data
+        scratch.sort()
+        return scratch[min(self.count - 1, int(q * (self.count - 1) + 0.5))]
+
+
+class Smoother:
+    """1系列分のまとめ方とヒステリシス"""
+    __slots__ = ("mode", "q", "alpha", "band", "buffer", "ema", "value")
+
+    def __init__(self, size, mode="ema", q=0.9, band=2.0):
+        if mode not in MODES:
+            raise ValueError(f"Unknown smoothing mode: {mode}")
+        self.mode = mode
+        self.q = q
+        # 窓のサンプル数 N に相当する EMA の係数
+        self.alpha = 2.0 / (size + 1)
+        self.band = band
+        self.buffer = RingBuffer(size)
+        self.ema = None
+        self.value = None
+
+    def feed(self, sample):
+        """サンプルを加え、公開値 (整数%) を返す"""
+        self.buffer.append(sample)
+        if self.mode == "ema":
+            self.ema = sample if self.ema is None else self.ema + self.alpha * (sample - self.ema)
+            aggregate = self.ema
+        elif self.mode == "max":
+            aggregate = self.buffer.max()
+        else:
+            aggregate = self.buffer.percentile(self.q)
+        # ヒステリシス: 公開値から band 以上離れたときだけ動かす
+        if self.value is None or abs(aggregate - self.value) >= self.band:
+            self.value = int(aggregate + 0.5)
+        return self.value
+
+
+class GPUSampler:
+    """GPUProvider を専用スレッドで読み続け、まとめた (GPU%, VRAM%) を公開する"""
+
+    def __init__(self, provider, rate=10.0, window=2.0, mode="ema", percentile=0.9, hysteresis=2.0):
+        """
+        :param rate: 1秒あたりのサンプル数
+        :param window: まとめる時間幅 (秒)
+        :param mode: ema / max / percentile
+        :param percentile: mode が percentile のときの分位 (0〜1)
+        :param hysteresis: 公開値を動かす最小の変化幅 (%)
+        """
+        self.provider = provider
+        self.period = 1.0 / rate
+        size = max(ceil(window * rate), 1)
+        self.gpu = Smoother(size, mode, percentile, hysteresis)
+        self.vram = Smoother(size, mode, percentile, hysteresis)
+        # GPU毎の (GPU, VRAM) の Smoother
+        self.device_smoothers = [
+            (Smoother(size, mode, percentile, hysteresis), Smoother(size, mode, percentile, hysteresis))
+            for _ in provider.indices
+        ] if len(provider.indices) > 1 else []
+        self.samples = 0
+        self.error = None
+        self._latest = None
+        self._devices = ()
+        self._vram_used = None
+        self._ready = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="gpu-sampler", daemon=True)
+
+    @classmethod
+    def from_config(cls, provider, config):
+        return cls(
+            provider,
+            rate=config.get("rate", 10.0),
+            window=config.get("window", 2.0),
+            mode=config.get("mode", "ema"),
+            percentile=config.get("percentile", 0.9),
+            hysteresis=config.get("hysteresis", 2.0),
+        )
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def wait_ready(self, timeout=None):
+        """最初のサンプル (またはエラー) が出るまで待つ"""
+        return self._ready.wait(timeout)
+
+    def _run(self):
+        next_at = time.monotonic()
+        while not self._stopped.is_set():
+            try:
+                (gpu, vram), readings, vram_used = self.provider.read_all()
+            except Exception as e:
+                # 送信ループの read() で投げ直す
+                self.error = e
+                self._ready.set()
+                return
+            # タプルを1回の代入で差し替える
+            latest = (self.gpu.feed(gpu), self.vram.feed(vram))
+            if self.device_smoothers:
+                self._devices = tuple(
+                    (gpu_smoother.feed(g), vram_smoother.feed(v))
+                    for (gpu_smoother, vram_smoother), (g, v) in zip(self.device_smoothers, readings)
+                )
+            else:
+                self._devices = (latest,)
+            # 使用量 (MB) は表示用の細かい値なのでまとめずに最新の値を使う
+            self._vram_used = vram_used
+            self._latest = latest
+            self.samples += 1
+            self._ready.set()
+            # 遅れた分は詰めずに次の周期へ
+            next_at += self.period
+            now = time.monotonic()
+            if next_at < now:
+                next_at = now
+            self._stopped.wait(next_at - now)
+
+    def read(self):
+        """まとめた (GPU使用率%, VRAM使用率%) を返す (最初のサンプル前は None)"""
+        if self.error is not None:
+            raise self.error
+        return self._latest
+
+    def devices(self):
+        """GPU毎にまとめた (GPU使用率%, VRAM使用率%) のタプル (provider.indices と同じ順)"""
+        return self._devices
+
+    def vram_used(self):
+        """最後に読んだVRAM使用量 (MB、分からなければ None)"""
+        return self._vram_used
+
+    def close(self):
+        """サンプリングを止める (読み取り中なら終わるまで待つ)"""
+        self._stopped.set()
+        # wait_ready() で待っているスレッドも起こす
+        self._ready.set()
+        if self._thread.is_alive():
+            self._thread.join()
@@ -0,0 +1,118 @@
+"""
+ヘッドレス (画面なし) の起動口。
+
+tkinter を読み込まず、設定ファイルで指定されたGPUプロバイダ (auto なら前回検出したもの) を開いて送信を続ける。
+常駐・自動起動向け。
+
+    python -m headless --config settings.json
+    python VRCOSCWatch.py --headless --config settings.json
+    python -m headless --record session.rec   (送信内容を記録。再生は python -m session_record)
+"""
+import argparse
+import os
+import signal
+import sys
+import threading
+
+from config_store import JsonStore
+from engine import SendEngine
+from gpu_detect import detect_gpu
+from gpu_providers import GPUProviderError
+from session_record import SessionRecorder
+from watch_logging import setup_logging, stop_logging
+import watch_settings
+
+# カレント取得
+currentDir = os.path.dirname(os.path.abspath(sys.executable if getattr(sys, 'frozen', False) else __file__))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="VRC-OSC-Watch を画面なしで動かす")
+    parser.add_argument("--headless", action="store_true", help="(VRCOSCWatch.py から起動する場合の指定)")
+    parser.add_argument("--config", default=os.path.join(currentDir, "settings.json"), help="設定ファイル")
+    parser.add_argument("--log-dir", default=os.path.join(currentDir, "log"), help="ログの出力先")
+    parser.add_argument("--record", help="読んだGPUの値・送ったOSCを記録するファイル")
+    args = parser.parse_args(argv)
+
+    logger = setup_logging(args.log_dir)
+    # 設定ファイルが書き換えられたら送信中のエンジンに反映する
+    store = JsonStore(args.config, loader=watch_settings.load_settings, logger=logger)
+    try:
+        settings = store.load()
+    except Exception as e:
+        logger.error(f"Error loading settings: {e}")
+        store.close()
+        stop_logging()
+        return 2
+    logger.setLevel(settings["logLevel"])
+
+    # GPUプロバイダは設定されたもの (auto なら前回検出したもの) だけを開く
+    provider = vendor = None
+    try:
+        detection = detect_gpu(
+            settings["gpuProvider"], settings["gpuCache"],
+            devices=settings["gpuDevices"], aggregate=settings["gpuAggregate"],
+        )
+        provider, vendor = detection.provider, detection.vendor
+        if settings["gpuProvider"] == "auto" and detection.cache is not None and detection.cache != settings["gpuCache"]:
+            settings["gpuCache"] = detection.cache
+            store.save(settings)
+    except GPUProviderError as e:
+        logger.info(f"GPU provider error ({settings['gpuProvider']}): {e}")
+    if provider is not None:
+        logger.info(f"GPU provider opened: {type(provider).__name__} ({provider.name})")
+
+    stopped = threading.Event()
+    exit_code = 0
+
+    def on_gpu_error(error):
+        nonlocal exit_code
+        logger.error(f"GPU error ({error.code}): {error}")
+        exit_code = 1
+        stopped.set()
+
+    engine = SendEngine(gpu_provider=provider, gpu_vendor=vendor, logger=logger, on_gpu_error=on_gpu_error)
+    if args.record:
+        engine.recorder = SessionRecorder(args.record)
+        logger.info(f"Recording to {args.record}")
+    try:
+        if settings["metricsPort"]:
+            engine.serve_metrics(settings["metricsPort"])
+        try:
+            engine.start(watch_settings.engine_config(settings))
+        except Exception as e:
+            logger.error(f"Start error: {e}")
+            return 2
+        logger.info(f"Headless started (config: {args.config})")
+
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: stopped.set())
+        # シグナルを受け取れるよう、短い間隔で待つ (ついでに設定ファイルの変更を見る)
+        while not stopped.wait(1.0):
+            reloaded = store.check()
+            if reloaded is not None:
+                # GPUプロバイダ・計測ポートの変更は再起動後に反映
+                logger.info("Settings reloaded")
+                settings = reloaded
+                logger.setLevel(settings["logLevel"])
+                config = watch_settings.engine_config(settings)
+                try:
+                    # 前回の設定で開始できずに止まっている場合は、直った設定で開始し直す
+                    if not engine.reconfigure(config):
+                        engine.start(config)
+                except Exception as e:
+                    logger.error(f"Start error: {e}")
+    finally:
+        engine.close()
+        if engine.recorder is not None:
+            engine.recorder.close()
+        store.close()
+        if provider is not None:
+            provider.close()
+        logger.info("Headless stopped")
+        stop_logging()
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+"""
+送信ループの計測。
+
+ステージ毎の処理時間ヒストグラムと、パラメータ毎の送信数・バイト数などのカウンタを持つ。
+記録は配列の加算だけで、テキストへの整形は誰かが読みに来たときにだけ行う。
+localhost の HTTP で Prometheus 形式のテキストとして公開できる。
+"""
+import threading
+from array import array
+from bisect import bisect_left
+
+# 処理時間 (秒) のバケット境界
+LATENCY_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+)
+
+# 計測するステージ
+STAGES = ("gpu_read", "encode", "send", "chat", "tick", "lateness")
+
+
+class Histogram:
+    """固定バケットのヒストグラム"""
+    __slots__ = ("bounds", "counts", "total", "count")
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = tuple(bounds)
+        # 最後の要素は +Inf
+        self.counts = array("Q", [0] * (len(self.bounds) + 1))
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q):
+        """バケット境界から分位点をおおまかに求める"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return self.bounds[i] if i < len(self.bounds) else float("inf")
+        return float("inf")
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class Metrics:
+    """送信ループのカウンタとヒストグラム"""
+
+    def __init__(self, param_names):
+        self.param_names = ()
+        self.param_packets = array("Q")
+        self.param_bytes = array("Q")
+        self.set_params(param_names)
+        self.stages = {stage: Histogram() for stage in STAGES}
+        self.ticks = 0
+        self.skipped_sends = 0
+        self.chat_packets = 0
+        # トークン切れで見送ったチャット
+        self.chat_throttled = 0
+        self.gpu_read_errors = 0
+        # 送信先毎のカウンタを返す関数 (エンジンが設定する)
+        self.destination_stats = list
+
+    def set_params(self, param_names):
+        """
+        送信するパラメータの組を差し替える。残ったパラメータのカウンタは引き継ぐ。
+        同じ Metrics を使い続けるので、HTTPサーバなどが持っている参照はそのまま有効。
+        """
+        previous = {
+            name: (packets, size)
+            for name, packets, size in zip(self.param_names, self.param_packets, self.param_bytes)
+        }
+        names = tuple(param_names)
+        self.param_packets = array("Q", [previous.get(name, (0, 0))[0] for name in names])
+        self.param_bytes = array("Q", [previous.get(name, (0, 0))[1] for name in names])
+        self.param_names = names
+
+    def record_param(self, i, size):
+        self.param_packets[i] += 1
+        self.param_bytes[i] += size
+
+    def summary(self):
+        """Tkのステータス表示用の要約"""
+        tick = self.stages["tick"]
+        return {
+            "ticks": self.ticks,
+            "tick_p50_ms": tick.quantile(0.5) * 1000,
+            "tick_p99_ms": tick.quantile(0.99) * 1000,
+            "gpu_read_ms": self.stages["gpu_read"].mean() * 1000,
+            "lateness_p99_ms": self.stages["lateness"].quantile(0.99) * 1000,
+            "packets": sum(self.param_packets) + self.chat_packets,
+            "skipped": self.skipped_sends,
+            "gpu_errors": self.gpu_read_errors,
+        }
+
+    def render_prometheus(self):
+        """Prometheus のテキスト形式に整形する"""
+        lines = [
+            "# TYPE watch_stage_seconds histogram",
+        ]
+        for stage, hist in self.stages.items():
+            cumulative = 0
+            for bound, n in zip(hist.bounds + (float("inf"),), hist.counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'watch_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'watch_stage_seconds_sum{{stage="{stage}"}} {hist.total}')
+            lines.append(f'watch_stage_seconds_count{{stage="{stage}"}} {hist.count}')
+
+        lines.append("# TYPE watch_param_packets_total counter")
+        for name, n in zip(self.param_names, self.param_packets):
+            lines.append(f'watch_param_packets_total{{param="{name}"}} {n}')
+        lines.append("# TYPE watch_param_bytes_total counter")
+        for name, n in zip(self.param_names, self.param_bytes):
+            lines.append(f'watch_param_bytes_total{{param="{name}"}} {n}')
+
+        lines.append("# TYPE watch_destination_packets_total counter")
+        destinations = self.destination_stats()
+        for dest in destinations:
+            lines.append(f'watch_destination_packets_total{{destination="{dest["name"]}"}} {dest["sent_packets"]}')
+        lines.append("# TYPE watch_destination_bytes_total counter")
+        for dest in destinations:
+            lines.append(f'watch_destination_bytes_total{{destination="{dest["name"]}"}} {dest["sent_bytes"]}')
+        lines.append("# TYPE watch_destination_dropped_total counter")
+        for dest in destinations:
+            lines.append(f'watch_destination_dropped_total{{destination="{dest["name"]}"}} {dest["dropped_packets"]}')
+
+        for name, value in (
+            ("watch_ticks_total", self.ticks),
+            ("watch_skipped_sends_total", self.skipped_sends),
+            ("watch_chat_packets_total", self.chat_packets),
+            ("watch_chat_throttled_total", self.chat_throttled),
+            ("watch_gpu_read_errors_total", self.gpu_read_errors),
+        ):
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """localhost だけで待ち受ける読み取り専用のHTTPサーバ (GET /metrics)"""
+
+    def __init__(self, metrics, port, host="127.0.0.1"):
+        # 使うときだけ読み込む (起動時間を短くするため)
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        metrics_ref = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics_ref.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # アクセスログは出さない
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self._thread = threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
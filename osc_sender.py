@@ -0,0 +1,317 @@
+"""
+OSCメッセージのエンコードと送信。
+
+アバターパラメータの値は 0〜9 の数字 (パック送信では 0〜99) だけなので、
+アドレスと値の組み合わせを起動時に全部エンコードしておき、
+送信時はキャッシュ済みのバイト列を同じUDPソケットから各送信先に書くだけにする。
+バンドルモードでは1ティック分のメッセージを1つのOSCバンドルにまとめる。
+"""
+import socket
+import struct
+import time
+from math import ceil
+
+_INT = struct.Struct(">i")
+_FLOAT = struct.Struct(">f")
+_TIMETAG = struct.Struct(">II")
+
+BUNDLE_HEADER = b"#bundle\0"
+# 1970年 (UNIX) と 1900年 (NTP) の差 (秒)
+NTP_EPOCH_OFFSET = 2208988800
+# 「即時」を表すタイムタグ
+IMMEDIATELY = 1
+
+
+def ceil_minifloat(value):
+    """1/128 刻みに切り上げる (受け取った側で value * 128 を丸めれば元の整数に戻る)"""
+    return ceil(value * 128) / 128
+
+
+def osc_string(value):
+    """OSC文字列 (NUL終端 + 4バイト境界までパディング)"""
+    data = value.encode("utf-8") if isinstance(value, str) else bytes(value)
+    return data + b"\0" * (4 - len(data) % 4)
+
+
+def osc_blob(value):
+    """OSC blob (長さ + データ + パディング)"""
+    pad = -len(value) % 4
+    return _INT.pack(len(value)) + value + b"\0" * pad
+
+
+def encode_message(address, *args):
+    """OSCメッセージを1つのデータグラムにエンコードする"""
+    tags = ","
+    payload = []
+    for arg in args:
+        if arg is True:
+            tags += "T"
+        elif arg is False:
+            tags += "F"
+        elif arg is None:
+            tags += "N"
+        elif isinstance(arg, int):
+            tags += "i"
+            payload.append(_INT.pack(arg))
+        elif isinstance(arg, float):
+            tags += "f"
+            payload.append(_FLOAT.pack(arg))
+        elif isinstance(arg, str):
+            tags += "s"
+            payload.append(osc_string(arg))
+        elif isinstance(arg, (bytes, bytearray)):
+            tags += "b"
+            payload.append(osc_blob(bytes(arg)))
+        else:
+            raise TypeError(f"Unsupported OSC argument type: {type(arg).__name__}")
+    return osc_string(address) + osc_string(tags) + b"".join(payload)
+
+
+def ntp_timetag(timestamp=None):
+    """UNIX時刻をOSCタイムタグ (NTP 64bit固定小数) に変換する"""
+    if timestamp is None:
+        timestamp = time.time()
+    seconds = int(timestamp)
+    fraction = int((timestamp - seconds) * (1 << 32)) & 0xFFFFFFFF
+    return ((seconds + NTP_EPOCH_OFFSET) << 32) | fraction
+
+
+def encode_bundle(datagrams, timetag=IMMEDIATELY):
+    """エンコード済みのメッセージ群を1つのOSCバンドルにまとめる"""
+    parts = [BUNDLE_HEADER, _TIMETAG.pack(timetag >> 32, timetag & 0xFFFFFFFF)]
+    for datagram in datagrams:
+        parts.append(_INT.pack(len(datagram)))
+        parts.append(datagram)
+    return b"".join(parts)
+
+
+def _read_string(data, offset):
+    end = data.index(b"\0", offset)
+    value = data[offset:end].decode("utf-8")
+    return value, (end + 4) & ~3
+
+
+def decode_message(data):
+    """OSCメッセージ1つを (アドレス, [引数...]) にデコードする"""
+    address, offset = _read_string(data, 0)
+    tags, offset = _read_string(data, offset)
+    args = []
+    for tag in tags[1:]:
+        if tag == "i":
+            args.append(_INT.unpack_from(data, offset)[0])
+            offset += 4
+        elif tag == "f":
+            args.append(_FLOAT.unpack_from(data, offset)[0])
+            offset += 4
+        elif tag == "s":
+            value, offset = _read_string(data, offset)
+            args.append(value)
+        elif tag == "b":
+            size = _INT.unpack_from(data, offset)[0]
+            offset += 4
+            args.append(bytes(data[offset:offset + size]))
+            offset += size + (-size % 4)
+        elif tag == "T":
+            args.append(True)
+        elif tag == "F":
+            args.append(False)
+        elif tag == "N":
+            args.append(None)
+        else:
+            raise ValueError(f"Unsupported OSC type tag: {tag}")
+    return address, args
+
+
+def decode_packet(data):
+    """OSCパケット (メッセージまたはバンドル) をメッセージのリストにデコードする"""
+    if not data.startswith(BUNDLE_HEADER):
+        return [decode_message(data)]
+    messages = []
+    offset = len(BUNDLE_HEADER) + _TIMETAG.size
+    while offset < len(data):
+        size = _INT.unpack_from(data, offset)[0]
+        offset += 4
+        messages.extend(decode_packet(data[offset:offset + size]))
+        offset += size
+    return messages
+
+
+class DatagramTable:
+    """パラメータ名 × 値 のエンコード済みデータグラム表"""
+
+    def __init__(self, params, values=range(10), floats=(), ranges=None):
+        """
+        :param params: {パラメータ名: OSCアドレス}
+        :param values: 事前にエンコードする値 (0 から始まる範囲)
+        :param floats: 値 v を ceil_minifloat(v / 128) の float で送るパラメータ名
+        :param ranges: {パラメータ名: 値の範囲} (省略したパラメータは values)
+        """
+        self.params = dict(params)
+        self.values = tuple(values)
+        self.floats = frozenset(floats)
+        ranges = ranges or {}
+        self._table = {
+            name: tuple(self.encode(name, value) for value in ranges.get(name, self.values))
+            for name in self.params
+        }
+
+    def encode(self, name, value):
+        if name in self.floats:
+            return encode_message(self.params[name], ceil_minifloat(value / 128))
+        return encode_message(self.params[name], value)
+
+    def get(self, name, value):
+        """キャッシュ済みのデータグラムを返す。表に無い値はその場でエンコードする"""
+        datagrams = self._table[name]
+        if 0 <= value < len(datagrams):
+            return datagrams[value]
+        return self.encode(name, value)
+
+
+class Destination:
+    """
+    送信先1つ分の設定と送信カウンタ。
+    params を指定した場合はそのパラメータだけを送る (None なら全部)。
+    """
+
+    def __init__(self, ip, port, params=None, chat=True, name=None):
+        self.ip = ip
+        self.port = int(port)
+        self.params = frozenset(params) if params is not None else None
+        self.chat = chat
+        self.name = name or f"{ip}:{port}"
+        # 名前解決は最初に1回だけ行う
+        self.address = socket.getaddrinfo(ip, self.port, socket.AF_INET, socket.SOCK_DGRAM)[0][4]
+        self.sent_packets = 0
+        self.sent_bytes = 0
+        self.dropped_packets = 0
+        self.last_error = None
+
+    @classmethod
+    def from_config(cls, config):
+        """settings.json の destinations の1要素から作る"""
+        return cls(
+            config["ip"],
+            config["port"],
+            params=config.get("params"),
+            chat=config.get("chat", True),
+            name=config.get("name"),
+        )
+
+    def accepts(self, param_name):
+        """param_name が None のときはチャット"""
+        if param_name is None:
+            return self.chat
+        return self.params is None or param_name in self.params
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "sent_packets": self.sent_packets,
+            "sent_bytes": self.sent_bytes,
+            "dropped_packets": self.dropped_packets,
+            "last_error": self.last_error,
+        }
+
+
+class _Route:
+    """同じフィルタを持つ送信先のまとまり (バンドルはまとまり毎に1回だけ組み立てる)"""
+
+    def __init__(self, destinations):
+        self.destinations = destinations
+        self.pending = []
+
+
+class OSCDatagramSender:
+    """
+    1つのノンブロッキングUDPソケットから複数の送信先へデータグラムを送る。
+    同じバイト列をフィルタに合う全送信先に書くだけなので、エンコードは1回で済む。
+    送信エラーはその場で OSError になるので、送信先毎の破棄数・最後のエラーに数えられる。
+    bundle=True のときは post() したメッセージを溜めておき、
+    flush() でタイムタグ付きの1つのバンドルとして送る。
+    """
+
+    def __init__(self, destinations, bundle=False, on_send=None):
+        """
+        :param on_send: 実際に送るデータグラム (バンドル後) を、同じフィルタの送信先のまとまり毎に1回受け取る関数
+        """
+        self.destinations = [
+            d if isinstance(d, Destination) else Destination(*d)
+            for d in destinations
+        ]
+        self.bundle = bundle
+        self.on_send = on_send
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self._sendto = self.sock.sendto
+
+        # フィルタが同じ送信先をまとめる
+        routes = {}
+        for dest in self.destinations:
+            routes.setdefault((dest.params, dest.chat), []).append(dest)
+        self.routes = [_Route(dests) for dests in routes.values()]
+        # パラメータ名 -> 送るべきルート のキャッシュ
+        self._route_cache = {}
+
+    def routes_for(self, param_name):
+        routes = self._route_cache.get(param_name)
+        if routes is None:
+            routes = tuple(r for r in self.routes if r.destinations[0].accepts(param_name))
+            self._route_cache[param_name] = routes
+        return routes
+
+    def send_to(self, dest, datagram):
+        """1つの送信先に送る。送信バッファが一杯なら捨てて他の送信先は止めない"""
+        try:
+            self._sendto(datagram, dest.address)
+            dest.sent_bytes += len(datagram)
+            dest.sent_packets += 1
+            return True
+        except OSError as e:
+            # UDPなので受信側がいない・詰まっている場合は次のティックに任せる
+            dest.dropped_packets += 1
+            dest.last_error = str(e)
+            return False
+
+    def send(self, datagram, param_name=None):
+        """フィルタに合う全送信先へすぐに送る"""
+        on_send = self.on_send
+        for route in self.routes_for(param_name):
+            if on_send is not None:
+                on_send(datagram)
+            for dest in route.destinations:
+                self.send_to(dest, datagram)
+
+    def post(self, datagram, param_name=None):
+        """バンドルモードなら溜め、そうでなければすぐ送信する"""
+        if self.bundle:
+            for route in self.routes_for(param_name):
+                route.pending.append(datagram)
+        else:
+            self.send(datagram, param_name)
+
+    def flush(self):
+        """溜めたメッセージを送信先毎に1つのデータグラムとして送信する"""
+        timetag = None
+        for route in self.routes:
+            pending = route.pending
+            if not pending:
+                continue
+            if len(pending) == 1:
+                datagram = pending[0]
+            else:
+                if timetag is None:
+                    timetag = ntp_timetag()
+                datagram = encode_bundle(pending, timetag)
+            pending.clear()
+            if self.on_send is not None:
+                self.on_send(datagram)
+            for dest in route.destinations:
+                self.send_to(dest, datagram)
+
+    def stats(self):
+        """送信先毎の送信カウンタ"""
+        return [dest.stats() for dest in self.destinations]
+
+    def close(self):
+        self.sock.close()
@@ -0,0 +1,89 @@
+"""
+ローカルのOSC受信口 (VRChatの代わり)。
+
+受け取ったパケットをデコードして数える。ベンチマークやリプレイの確認用。
+
+    python -m osc_sink --port 9000
+"""
+import argparse
+import socket
+import threading
+import time
+
+from osc_sender import decode_packet
+
+
+class OSCSink:
+    """別スレッドでUDPを受信し、デコードしたメッセージを数える"""
+
+    def __init__(self, host="127.0.0.1", port=0, keep_messages=False, on_message=None):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        self.sock.bind((host, port))
+        self.sock.settimeout(0.2)
+        self.port = self.sock.getsockname()[1]
+        self.keep_messages = keep_messages
+        self.on_message = on_message
+        self.packets = 0
+        self.bytes = 0
+        self.message_count = 0
+        self.decode_errors = 0
+        self.messages = []
+        # アドレス毎の最新値
+        self.latest = {}
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="osc-sink", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                data = self.sock.recv(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self.packets += 1
+            self.bytes += len(data)
+            try:
+                messages = decode_packet(data)
+            except Exception:
+                self.decode_errors += 1
+                continue
+            self.message_count += len(messages)
+            for address, args in messages:
+                self.latest[address] = args
+                if self.keep_messages:
+                    self.messages.append((time.monotonic(), address, args))
+                if self.on_message is not None:
+                    self.on_message(address, args)
+
+    def reset(self):
+        self.packets = self.bytes = self.message_count = self.decode_errors = 0
+        self.messages.clear()
+
+    def close(self):
+        self._stopped.set()
+        self._thread.join()
+        self.sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="受信したOSCメッセージを表示する")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    args = parser.parse_args()
+
+    sink = OSCSink(args.host, args.port, on_message=lambda address, values: print(address, *values))
+    print(f"listening on {args.host}:{sink.port}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sink.close()
+
+
+if __name__ == "__main__":
+    main()
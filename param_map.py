@@ -0,0 +1,169 @@
+"""
+アバターパラメータの割り当て (設定の paramMap)。
+
+値の取り出し元 (source)・変換 (scale → clamp → 桁分け or float)・送り先のパラメータを設定に並べ、
+送信開始時に1回だけ送信計画にまとめる。送信ループは発火したグループの計画を順に回し、
+変換済みの値を ParamStateTable に入れるだけ。アドレスのエンコードも DatagramTable で事前に済ませる。
+
+    {"source": "gpu", "name": "GPU", "digits": 2}                       → GPUTenPlace, GPUZeroPlace
+    {"source": "minute", "name": "Minute"}                              → Minute (0〜99 の int)
+    {"source": "cpu", "name": "CPU", "type": "float"}                   → CPU (値/128 を 1/128 刻みの float)
+    {"source": "vram_mb", "name": "VRAMGB", "scale": 0.01, "digits": 3} → 0.1GB 単位の3桁
+    {"source": "gpu1", "name": "GPU1", "digits": 2}                     → インデックス1のGPU
+
+source は clock (hour, minute, second, day, month, year, weekday)、gpu (gpu, vram, vram_mb,
+gpu<インデックス>, vram<インデックス>)、system (cpu, ram, net) のどれかで、そのグループが発火したときに更新される
+(second を使う場合は rates の clock を 1 秒にする)。
+paramMap を省略すると encoding・gpuParams・systemSources から従来どおりの割り当てを作る。
+"""
+import re
+
+from system_sources import KINDS
+
+CLOCK_SOURCES = ("hour", "minute", "second", "day", "month", "year", "weekday")
+GPU_SOURCES = ("gpu", "vram", "vram_mb")
+# GPU毎の値 (gpu1, vram1 など)
+DEVICE_SOURCE = re.compile(r"(gpu|vram)(\d+)$")
+# 桁毎のパラメータ名の接尾辞 (1の位から)
+PLACES = ("ZeroPlace", "TenPlace", "HundredPlace", "ThousandPlace")
+TYPES = ("int", "float")
+# 事前にエンコードする値の上限 (これより大きい値はその場でエンコードする)
+MAX_PRECOMPUTED = 255
+# float で送る値の範囲 (値/128 が VRChat の float パラメータの -1〜1 に収まる)
+FLOAT_LIMIT = 127
+
+
+class MappingError(ValueError):
+    pass
+
+
+def source_group(source):
+    """source が更新されるグループ名"""
+    if source in CLOCK_SOURCES:
+        return "clock"
+    if source in GPU_SOURCES or DEVICE_SOURCE.match(source):
+        return "gpu"
+    if source in KINDS:
+        return "system"
+    raise MappingError(f"Unknown source: {source}")
+
+
+def make_transform(scale, low, high):
+    """scale を掛けて切り捨て、low〜high に収める関数を作る"""
+    if scale == 1:
+        return lambda value: min(max(int(value), low), high)
+    return lambda value: min(max(int(value * scale), low), high)
+
+
+def default_mappings(config):
+    """encoding・gpuParams・systemSources から従来の割り当てを作る"""
+    encoding = config.get("encoding", {})
+
+    def mapping(source, name, group, as_float):
+        # digits は 0〜9 の int 2つ、packed は時計なら int 1つ、GPU・CPU等なら float 1つ
+        if encoding.get(group) == "packed":
+            return {"source": source, "name": name, "type": "float" if as_float else "int"}
+        return {"source": source, "name": name, "digits": 2}
+
+    mappings = [
+        mapping("hour", "Hour", "clock", False),
+        mapping("minute", "Minute", "clock", False),
+        mapping("gpu", "GPU", "gpu", True),
+        mapping("vram", "VRAM", "gpu", True),
+    ]
+    for index, prefixes in config.get("gpuParams", {}).items():
+        for key in ("gpu", "vram"):
+            if prefixes.get(key):
+                mappings.append(mapping(f"{key}{index}", prefixes[key], "gpu", True))
+    for kind, prefix in config.get("systemSources", {}).items():
+        mappings.append(mapping(kind, prefix, "system", True))
+    return mappings
+
+
+class SendPlan:
+    """コンパイル済みの割り当て"""
+
+    def __init__(self):
+        # {パラメータ名: OSCアドレス} (割り当ての順)
+        self.params = {}
+        # float で送るパラメータ名と、事前にエンコードする値の範囲
+        self.floats = []
+        self.ranges = {}
+        # グループ毎の (source, 変換関数, パラメータ名の列 (上の桁から))
+        self.groups = {"clock": [], "gpu": [], "system": []}
+        # 使う source (割り当ての順)
+        self.sources = []
+        # GPU毎の source の (GPU毎の値の位置, 値の種類 0=GPU/1=VRAM, source)
+        self.devices = []
+
+    def add(self, mapping, gpu_indices=()):
+        """割り当てを1つ追加する (不正なら MappingError)"""
+        source = mapping.get("source")
+        name = mapping.get("name")
+        if not source or not name:
+            raise MappingError("source and name are required")
+        group = source_group(source)
+        device = DEVICE_SOURCE.match(source)
+        if device is not None:
+            index = int(device.group(2))
+            if index not in gpu_indices:
+                raise MappingError(f"GPU index {index} is not opened")
+        digits = int(mapping.get("digits", 0))
+        if not 0 <= digits <= len(PLACES):
+            raise MappingError(f"digits must be between 0 and {len(PLACES)}: {name}")
+        kind = mapping.get("type", "int")
+        if kind not in TYPES:
+            raise MappingError(f"Unknown type: {kind}")
+        if kind == "float" and digits:
+            raise MappingError(f"float parameters cannot be split into digits: {name}")
+        # 既定の上限は桁数に収まる最大値 (桁分けしない場合は 99)
+        low, high = mapping.get("clamp", (0, 10 ** (digits or 2) - 1))
+        low, high = int(low), int(high)
+        # int は 0 以上 (負の値は桁に分けられない)、float は値/128 が -1〜1 に収まる範囲
+        if kind == "int" and low < 0:
+            raise MappingError(f"int parameters cannot be negative: {name}")
+        if kind == "float" and not -FLOAT_LIMIT <= low <= high <= FLOAT_LIMIT:
+            raise MappingError(f"float clamp must be within -{FLOAT_LIMIT} to {FLOAT_LIMIT}: {name}")
+        if digits:
+            names = tuple(name + PLACES[i] for i in reversed(range(digits)))
+            addresses = [f"/avatar/parameters/{n}" for n in names]
+        else:
+            names = (name,)
+            addresses = [mapping.get("address") or f"/avatar/parameters/{name}"]
+        for n in names:
+            if n in self.params:
+                raise MappingError(f"Duplicate parameter: {n}")
+
+        self.params.update(zip(names, addresses))
+        if not digits:
+            self.ranges[name] = range(min(max(high, 0), MAX_PRECOMPUTED) + 1)
+            if kind == "float":
+                self.floats.append(name)
+        self.groups[group].append((source, make_transform(float(mapping.get("scale", 1)), low, high), names))
+        if source not in self.sources:
+            self.sources.append(source)
+            if device is not None:
+                self.devices.append((gpu_indices.index(index), 0 if device.group(1) == "gpu" else 1, source))
+
+    def bind(self, index):
+        """パラメータ名をインデックスにして、グループ毎の (source, 変換関数, スロット) の列を返す"""
+        return {
+            group: tuple((source, transform, tuple(index[n] for n in names)) for source, transform, names in entries)
+            for group, entries in self.groups.items()
+        }
+
+
+def compile_plan(mappings, gpu_indices=(), log=None):
+    """
+    割り当ての列を SendPlan にする。不正な割り当ては log(メッセージ) に出して飛ばす。
+    :param gpu_indices: 開いているGPUのインデックス (gpu_provider.indices の順)
+    """
+    plan = SendPlan()
+    gpu_indices = tuple(gpu_indices)
+    for mapping in mappings:
+        try:
+            plan.add(mapping, gpu_indices)
+        except (MappingError, TypeError, ValueError) as e:
+            if log is not None:
+                log(f"Skipping parameter mapping {mapping}: {e}")
+    return plan
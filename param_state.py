@@ -0,0 +1,91 @@
+"""
+アバターパラメータの送信状態テーブル。
+
+パラメータ毎に「現在値・最後に送った値・最後に送った時刻・キープアライブ間隔・最短送信間隔」を
+インデックスで引ける配列に持つ。due() の1回の走査で「変化した or キープアライブ時刻が来た」
+パラメータが分かる。送信を止めたパラメータ (今のアバターに無いもの) は due() に出てこない。
+"""
+from array import array
+
+# まだ一度も送っていないことを表す値 (割り当ての clamp で取りうる値の範囲外)
+UNSENT = -2 ** 31
+
+
+class ParamStateTable:
+    __slots__ = ("names", "index", "values", "sent_values", "last_sent", "keepalive", "min_gap", "enabled", "_due")
+
+    def __init__(self, names, keepalive=10.0, min_gap=0.0, overrides=None):
+        """
+        :param names: パラメータ名の列 (この順番がインデックスになる)
+        :param keepalive: 値が変わらなくても再送する間隔 (秒)
+        :param min_gap: 同じパラメータを続けて送るときの最短間隔 (秒)
+        :param overrides: {パラメータ名: {"keepalive": 秒, "minGap": 秒}}
+        """
+        self.names = tuple(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        count = len(self.names)
+        self.values = array("i", [UNSENT] * count)
+        self.sent_values = array("i", [UNSENT] * count)
+        self.last_sent = array("d", [0.0] * count)
+        self.keepalive = array("d", [float(keepalive)] * count)
+        self.min_gap = array("d", [float(min_gap)] * count)
+        self.enabled = array("b", [1] * count)
+        for name, rates in (overrides or {}).items():
+            i = self.index.get(name)
+            if i is None:
+                continue
+            if "keepalive" in rates:
+                self.keepalive[i] = float(rates["keepalive"])
+            if "minGap" in rates:
+                self.min_gap[i] = float(rates["minGap"])
+        # due() の結果を入れ直して使い回すリスト
+        self._due = []
+
+    def set_value(self, slot, value):
+        """
+        slot (上の桁から順のインデックス) に値を桁に分けて入れる。
+        インデックスが1つだけのスロットには値をそのまま入れる。
+        """
+        values = self.values
+        for i in reversed(slot[1:]):
+            values[i] = value % 10
+            value //= 10
+        values[slot[0]] = value
+
+    def due(self, now):
+        """
+        変化した、またはキープアライブ時刻を過ぎたパラメータのインデックスを返す。
+        最短送信間隔を満たしていないものは次回に回す。
+        返すリストは次の呼び出しで上書きされる。
+        """
+        due = self._due
+        due.clear()
+        values, sent_values, last_sent = self.values, self.sent_values, self.last_sent
+        keepalive, min_gap, enabled = self.keepalive, self.min_gap, self.enabled
+        for i in range(len(values)):
+            value = values[i]
+            if value == UNSENT or not enabled[i]:
+                continue
+            elapsed = now - last_sent[i]
+            if sent_values[i] == UNSENT:
+                due.append(i)
+            elif value != sent_values[i]:
+                if elapsed >= min_gap[i]:
+                    due.append(i)
+            elif elapsed >= keepalive[i]:
+                due.append(i)
+        return due
+
+    def mark_sent(self, i, now):
+        """送信したことを記録する"""
+        self.sent_values[i] = self.values[i]
+        self.last_sent[i] = now
+
+    def invalidate(self):
+        """全パラメータを未送信扱いにして次の due() で全部送らせる"""
+        for i in range(len(self.sent_values)):
+            self.sent_values[i] = UNSENT
+
+    def set_enabled(self, i, enabled):
+        """パラメータを送るかどうかを切り替える"""
+        self.enabled[i] = 1 if enabled else 0
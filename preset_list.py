@@ -0,0 +1,142 @@
+"""
+チャットプリセットの一覧。
+
+見えている行の分だけウィジェットを作っておき、スクロール・並べ替え・削除・有効/無効の切り替えでは
+行の中身 (文字とボタンの状態) だけを書き換える。プリセットが何百個あっても作り直しは起きない。
+"""
+import tkinter as tk
+from collections import namedtuple
+
+_Row = namedtuple("_Row", ("frame", "up", "down", "text", "delete"))
+
+
+class PresetList(tk.Frame):
+    """行ウィジェットを使い回すプリセット一覧"""
+
+    def __init__(self, master, items, on_select, on_delete, on_move, rows=8):
+        """
+        :param items: プリセットのリスト (呼び出し側のリストをそのまま参照する)
+        :param on_select: on_select(index) プリセットが押されたとき
+        :param on_delete: on_delete(index) 削除ボタン
+        :param on_move: on_move(index, delta) ↑(-1) / ↓(+1) ボタン
+        :param rows: 一度に表示する行数
+        """
+        super().__init__(master)
+        self.items = items
+        self.on_select = on_select
+        self.on_delete = on_delete
+        self.on_move = on_move
+        self.enabled = False
+        # 一番上に表示しているプリセットのインデックス
+        self.first = 0
+        self.rows = []
+        # 行毎に最後に設定した内容 (変わらない行は config しない)
+        self._shown = [None] * rows
+
+        for slot in range(rows):
+            frame = tk.Frame(self)
+            up = tk.Button(frame, text="↑", width=2, command=lambda s=slot: self._move(s, -1))
+            up.pack(side='left')
+            down = tk.Button(frame, text="↓", width=2, command=lambda s=slot: self._move(s, 1))
+            down.pack(side='left')
+            text = tk.Button(frame, anchor='w', command=lambda s=slot: self._select(s))
+            text.pack(side='left', expand=True, fill='x', padx=(1, 0))
+            delete = tk.Button(frame, text="削除", command=lambda s=slot: self._delete(s))
+            delete.pack(side='right')
+            frame.grid(row=slot, column=0, sticky="ew", pady=1)
+            frame.grid_remove()
+            for widget in (frame, up, down, text, delete):
+                self._bind_wheel(widget)
+            self.rows.append(_Row(frame, up, down, text, delete))
+
+        self.scrollbar = tk.Scrollbar(self, orient=tk.VERTICAL, command=self.yview)
+        self.scrollbar.grid(row=0, column=1, rowspan=rows, sticky="ns")
+        self.columnconfigure(0, weight=1)
+        self._bind_wheel(self)
+        self.refresh()
+
+    def _bind_wheel(self, widget):
+        # Windows/macOS は MouseWheel、Linux は Button-4/5
+        widget.bind("<MouseWheel>", lambda e: self.scroll(-1 if e.delta > 0 else 1))
+        widget.bind("<Button-4>", lambda e: self.scroll(-1))
+        widget.bind("<Button-5>", lambda e: self.scroll(1))
+
+    def set_enabled(self, enabled):
+        """全行のボタンの有効/無効を切り替える"""
+        if enabled != self.enabled:
+            self.enabled = enabled
+            self.refresh()
+
+    def scroll(self, rows):
+        self.first += rows
+        self.refresh()
+
+    def see(self, index):
+        """index の行が見える位置までスクロールする"""
+        if index < self.first:
+            self.first = index
+        elif index >= self.first + len(self.rows):
+            self.first = index - len(self.rows) + 1
+        self.refresh()
+
+    def yview(self, *args):
+        """スクロールバーからの操作"""
+        if args[0] == "moveto":
+            self.first = int(float(args[1]) * len(self.items) + 0.5)
+        elif args[0] == "scroll":
+            step = len(self.rows) if args[2] == "pages" else 1
+            self.first += int(args[1]) * step
+        self.refresh()
+
+    def refresh(self):
+        """見えている行の中身だけを今のリストに合わせる"""
+        count = len(self.items)
+        visible = len(self.rows)
+        self.first = max(0, min(self.first, count - visible))
+        state = tk.NORMAL if self.enabled else tk.DISABLED
+        for slot, row in enumerate(self.rows):
+            i = self.first + slot
+            if i >= count:
+                if self._shown[slot] is not None:
+                    row.frame.grid_remove()
+                    self._shown[slot] = None
+                continue
+            shown = (
+                self.items[i],
+                state,
+                state if i > 0 else tk.DISABLED,
+                state if i < count - 1 else tk.DISABLED,
+            )
+            previous = self._shown[slot]
+            if shown == previous:
+                continue
+            if previous is None:
+                row.frame.grid()
+            row.text.config(text=shown[0], state=state)
+            row.delete.config(state=state)
+            row.up.config(state=shown[2])
+            row.down.config(state=shown[3])
+            self._shown[slot] = shown
+        if count > visible:
+            self.scrollbar.set(self.first / count, (self.first + visible) / count)
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def _index(self, slot):
+        i = self.first + slot
+        return i if i < len(self.items) else None
+
+    def _select(self, slot):
+        i = self._index(slot)
+        if i is not None:
+            self.on_select(i)
+
+    def _delete(self, slot):
+        i = self._index(slot)
+        if i is not None:
+            self.on_delete(i)
+
+    def _move(self, slot, delta):
+        i = self._index(slot)
+        if i is not None:
+            self.on_move(i, delta)
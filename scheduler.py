@@ -0,0 +1,117 @@
+"""
+パラメータグループ毎の送信スケジューラ。
+
+「処理してから sleep(interval)」ではなく、モノトニック時計の締め切り
+(deadline) を積み上げていくので、処理時間によって周期がずれていかない。
+時計の桁は壁時計の分の切り替わりぴったりに送信する。
+"""
+import asyncio
+import time
+from contextlib import suppress
+from math import floor
+
+# 分の切り替わり直後に起きるための余裕 (秒)
+WAKE_MARGIN = 0.002
+
+
+class IntervalClock:
+    """一定間隔で発火するグループ"""
+
+    def __init__(self, name, interval):
+        self.name = name
+        self.interval = float(interval)
+        self.deadline = None
+
+    def start(self, mono, wall):
+        """最初は即時に発火させる"""
+        self.deadline = mono
+
+    def advance(self, mono, wall):
+        """次の締め切りを前回の締め切り基準で決める (遅れても周期はずれない)"""
+        self.deadline += self.interval
+        if self.deadline <= mono:
+            # 大きく遅れた場合は取りこぼした分を飛ばす
+            missed = floor((mono - self.deadline) / self.interval) + 1
+            self.deadline += missed * self.interval
+
+
+class MinuteAlignedClock(IntervalClock):
+    """壁時計の interval 秒刻みと、分の切り替わりで発火するグループ"""
+
+    def advance(self, mono, wall):
+        t = wall + WAKE_MARGIN
+        next_tick = (floor(t / self.interval) + 1) * self.interval
+        next_minute = (floor(t / 60) + 1) * 60
+        self.deadline = mono + (min(next_tick, next_minute) - wall) + WAKE_MARGIN
+
+
+class AdaptiveClock(IntervalClock):
+    """値が変化している間は速く、落ち着いたら徐々に遅く発火するグループ"""
+
+    def __init__(self, name, min_interval, max_interval, backoff=1.5):
+        super().__init__(name, min_interval)
+        self.min_interval = float(min_interval)
+        self.max_interval = max(float(max_interval), self.min_interval)
+        self.backoff = backoff
+
+    def feed(self, changed):
+        """サンプリング結果を受けて次の間隔を決める"""
+        if changed:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+
+
+class DeadlineScheduler:
+    """複数グループの締め切りを管理し、一番近い締め切りまで眠る"""
+
+    def __init__(self, clocks, monotonic=time.monotonic, wall=time.time):
+        self.clocks = list(clocks)
+        self.monotonic = monotonic
+        self.wall = wall
+        self.lateness = 0.0
+        # wake() で待ちを途中で終わらせるためのイベント (enable_wake() で作る)
+        self._wake = None
+        mono, now = monotonic(), wall()
+        for clock in self.clocks:
+            clock.start(mono, now)
+
+    def next_deadline(self):
+        return min(clock.deadline for clock in self.clocks)
+
+    def due(self, mono=None):
+        """締め切りを過ぎたグループを返す"""
+        if mono is None:
+            mono = self.monotonic()
+        return [clock for clock in self.clocks if clock.deadline <= mono]
+
+    def enable_wake(self):
+        """wake() を使えるようにする (ループのスレッドから呼ぶ)"""
+        self._wake = asyncio.Event()
+
+    def wake(self):
+        """async_wait() を締め切り前に戻らせる (ループのスレッドから呼ぶ)"""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def async_wait(self):
+        """次の締め切りまで待ち、発火したグループを返す (待っている間にキャンセルできる)"""
+        deadline = self.next_deadline()
+        delay = deadline - self.monotonic()
+        # 締め切りを過ぎていても一度はループに制御を返す (停止要求を受け付けるため)
+        if self._wake is None:
+            await asyncio.sleep(max(delay, 0))
+        else:
+            # wake() されたら締め切り前でも戻る (発火したグループは無いこともある)
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wake.wait(), max(delay, 0))
+            self._wake.clear()
+        mono = self.monotonic()
+        self.lateness = max(0.0, mono - deadline)
+        return self.due(mono)
+
+    def reschedule(self, clocks):
+        """処理し終わったグループの次の締め切りを決める"""
+        mono, now = self.monotonic(), self.wall()
+        for clock in clocks:
+            clock.advance(mono, now)
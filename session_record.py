@@ -0,0 +1,257 @@
+"""
+送信セッションの記録と再生。
+
+send_messages が読んだGPUの値 (VRAM使用量を含む)・送ったチャット・送ったOSCデータグラム (バンドルモードならバンドル) を、単調時計の経過時間付きで
+長さ付きのバイナリレコードとして書き出す。読み込みは mmap で行う。
+
+再生は2通り:
+- pipeline: 記録したGPUの値とチャットを SendEngine に流し直す (GPUの無い Linux でも動く)
+- osc: 記録したデータグラムをそのままの間隔で送り直す
+
+どちらも --speed で早送りでき、送信先を省略するとローカルの受信口 (OSCSink) に送って集計を表示する。
+
+    python -m headless --record session.rec
+    python -m session_record session.rec --speed 100
+"""
+import argparse
+import mmap
+import socket
+import struct
+import sys
+import time
+from bisect import bisect_right
+
+from chat_scheduler import ChatFeed
+from engine import SendEngine
+from gpu_providers import GPUProvider
+from osc_sink import OSCSink
+from watch_settings import default_settings, engine_config, load_settings
+
+MAGIC = b"VOWREC2\0"
+# ファイル先頭: マジック, 記録開始時刻 (UNIX秒)
+HEADER = struct.Struct("<8sd")
+# レコード: 種類, 記録開始からの経過秒 (単調時計), ペイロード長
+RECORD = struct.Struct("<BdI")
+# GPU使用率%, VRAM使用率%, VRAM使用量 MB (プロバイダが返さなければ -1)
+GPU_PAYLOAD = struct.Struct("<hhi")
+
+# レコードの種類
+GPU = 1
+CHAT = 2
+OSC = 3
+
+
+class SessionRecorder:
+    """レコードをバッファ付きでファイルに追記する"""
+
+    def __init__(self, path, monotonic=time.monotonic):
+        self.path = path
+        self.monotonic = monotonic
+        self.records = 0
+        self._file = open(path, "wb")
+        self._file.write(HEADER.pack(MAGIC, time.time()))
+        self._start = monotonic()
+
+    def write(self, kind, payload):
+        self._file.write(RECORD.pack(kind, self.monotonic() - self._start, len(payload)))
+        self._file.write(payload)
+        self.records += 1
+
+    def gpu(self, gpu, vram, vram_used=None):
+        self.write(GPU, GPU_PAYLOAD.pack(gpu, vram, -1 if vram_used is None else vram_used))
+
+    def chat(self, message):
+        self.write(CHAT, message.encode("utf-8"))
+
+    def osc(self, datagram):
+        self.write(OSC, datagram)
+
+    def close(self):
+        self._file.close()
+
+
+class SessionReader:
+    """記録ファイルを mmap して先頭から順にレコードを返す"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.started_at = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f"Not a session recording: {path}")
+
+    def __iter__(self):
+        """(種類, 経過秒, ペイロード) を返す。最後のレコードが書きかけなら読み飛ばす"""
+        data = self._map
+        size = len(data)
+        offset = HEADER.size
+        while offset + RECORD.size <= size:
+            kind, t, length = RECORD.unpack_from(data, offset)
+            offset += RECORD.size
+            if offset + length > size:
+                break
+            yield kind, t, data[offset:offset + length]
+            offset += length
+
+    def gpu_samples(self):
+        """[(経過秒, GPU%, VRAM%, VRAM使用量 MB (無ければ -1))]"""
+        return [(t, *GPU_PAYLOAD.unpack(payload)) for kind, t, payload in self if kind == GPU]
+
+    def chat_messages(self):
+        """[(経過秒, メッセージ)]"""
+        return [(t, payload.decode("utf-8")) for kind, t, payload in self if kind == CHAT]
+
+    def duration(self):
+        last = 0.0
+        for _, t, _ in self:
+            last = t
+        return last
+
+    def close(self):
+        self._map.close()
+
+
+class ReplayProvider(GPUProvider):
+    """記録したGPUの値 (VRAM使用量を含む) を、経過時間 × speed の時点の値として返す"""
+    vendor = "REPLAY"
+
+    def __init__(self, samples, speed=1.0, monotonic=time.monotonic):
+        super().__init__(0)
+        self.times = [t for t, _, _, _ in samples]
+        self.values = [(gpu, vram) for _, gpu, vram, _ in samples]
+        self.used = [None if used < 0 else used for _, _, _, used in samples]
+        self.speed = speed
+        self.monotonic = monotonic
+
+    def open(self):
+        if not self.values:
+            raise ValueError("No GPU samples in the recording")
+        self.name = "Replay"
+        self._start = self.monotonic()
+        return super().open()
+
+    def read(self):
+        t = (self.monotonic() - self._start) * self.speed
+        # 記録の最後を過ぎたら最後の値のまま
+        i = max(bisect_right(self.times, t) - 1, 0)
+        self.vram_used = self.used[i]
+        return self.values[i]
+
+
+def replay_osc(reader, speed, host, port):
+    """記録したデータグラムを記録どおりの間隔 (÷ speed) で送り直す"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    start = time.monotonic()
+    sent = 0
+    try:
+        for kind, t, payload in reader:
+            if kind != OSC:
+                continue
+            delay = start + t / speed - time.monotonic()
+            # 細かすぎる待ちは詰めて送る
+            if delay > 0.001:
+                time.sleep(delay)
+            sock.sendto(payload, (host, port))
+            sent += 1
+    finally:
+        sock.close()
+    return sent
+
+
+def replay_config(settings, speed, host, port):
+    """設定から再生用のエンジン設定を作る (間隔は全部 ÷ speed)"""
+    config = engine_config(settings)
+    config["destinations"] = [{"ip": host, "port": port}]
+    config["rates"] = {key: value / speed for key, value in config["rates"].items()}
+    config["keepalive"] /= speed
+    config["minSendGap"] /= speed
+    config["paramRates"] = {
+        name: {key: value / speed for key, value in rates.items()}
+        for name, rates in config["paramRates"].items()
+    }
+    chat = config["chat"]
+    chat["refresh"] /= speed
+    chat["rotateInterval"] /= speed
+    chat["tokenRate"] *= speed
+    # 記録した値はサンプラを通した後の値なのでそのまま読む。
+    # GPU毎の値・CPU等・アバターの切り替えは記録していないので使わない
+    config["gpuSampling"] = {"rate": 0}
+    config["gpuParams"] = {}
+    config["systemSources"] = {}
+    config["avatarWatch"] = dict(config["avatarWatch"], enabled=False)
+    config["logSummaryInterval"] = 3600.0
+    return config
+
+
+def replay_pipeline(reader, speed, host, port, settings=None):
+    """記録したGPUの値とチャットを SendEngine に流し直す"""
+    chats = reader.chat_messages()
+    feed = ChatFeed()
+    # 送ったチャットはその時点より前に公開されていたので、最初の分は開始前に公開しておく
+    if chats:
+        feed.publish(chats[0][1])
+    provider = ReplayProvider(reader.gpu_samples(), speed).open()
+    engine = SendEngine(provider, provider.vendor, chat_feed=feed)
+    try:
+        engine.start(replay_config(settings or default_settings(), speed, host, port))
+        start = time.monotonic()
+        for t, message in chats[1:]:
+            delay = start + t / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            feed.publish(message)
+        remaining = start + reader.duration() / speed - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+    finally:
+        engine.close()
+    return engine.metrics.summary()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="記録したセッションを再生する")
+    parser.add_argument("path", help="記録ファイル")
+    parser.add_argument("--speed", type=float, default=1.0, help="再生速度 (100 で100倍速)")
+    parser.add_argument("--mode", choices=("pipeline", "osc"), default="pipeline", help="再生のしかた")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="送信先のポート (省略時はローカルの受信口)")
+    parser.add_argument("--config", help="pipeline で使う設定ファイル (送信間隔・エンコード。省略時は初期値)")
+    args = parser.parse_args(argv)
+
+    try:
+        reader = SessionReader(args.path)
+    except (OSError, ValueError) as e:
+        print(f"Cannot read {args.path}: {e}", file=sys.stderr)
+        return 1
+    sink = OSCSink(args.host) if not args.port else None
+    port = sink.port if sink is not None else args.port
+    print(f"replaying {args.path} ({reader.duration():.1f}s) at x{args.speed:g} to {args.host}:{port}")
+    try:
+        if args.mode == "osc":
+            print(f"sent {replay_osc(reader, args.speed, args.host, port)} datagrams")
+        else:
+            settings = load_settings(args.config) if args.config else None
+            try:
+                summary = replay_pipeline(reader, args.speed, args.host, port, settings)
+            except ValueError as e:
+                # GPUの値が1つも記録されていない (短すぎる・GPU無し) 場合は osc でなら再生できる
+                print(f"Cannot replay the pipeline: {e} (try --mode osc)", file=sys.stderr)
+                return 1
+            print(f"ticks={summary['ticks']} packets={summary['packets']} skipped={summary['skipped']}")
+        if sink is not None:
+            # 受信スレッドが追いつくのを待つ
+            time.sleep(0.3)
+            print(f"sink received {sink.packets} packets / {sink.message_count} messages")
+            for address, values in sorted(sink.latest.items()):
+                print(f"  {address} {values}")
+    finally:
+        if sink is not None:
+            sink.close()
+        reader.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,283 @@
+"""
+CPU・RAM・ネットワークのテレメトリ。
+
+GPUプロバイダと同じく open() で一度だけ準備し、read() で 0〜99 の値を返す。
+Linux では /proc/stat, /proc/meminfo, /proc/net/dev を開いたままにして、毎回
+os.preadv で使い回しのバッファに先頭から読み直し、数値はバッファ上でそのまま読む。
+CPU使用率と通信量は前回の読み取りからの差分で求める。Linux 以外では psutil があればそれを使う。
+"""
+import os
+import sys
+import time
+
+# settings.json の systemSources で指定できる種類
+KINDS = ("cpu", "ram", "net")
+
+
+class SourceError(Exception):
+    """テレメトリの初期化・読み取りエラー"""
+
+
+class ProcFile:
+    """開いたままの /proc のファイルを使い回しのバッファに読み直す"""
+    __slots__ = ("path", "fd", "buf")
+
+    def __init__(self, path, size=4096):
+        self.path = path
+        try:
+            self.fd = os.open(path, os.O_RDONLY)
+        except OSError as e:
+            raise SourceError(f"Failed to open {path}: {e}")
+        self.buf = bytearray(size)
+
+    def read(self, whole=True):
+        """
+        先頭から読み直し、読んだバイト数を返す (内容は self.buf)
+        :param whole: False ならバッファに入る分だけ読む (先頭の行だけ使う場合)
+        """
+        while True:
+            n = os.preadv(self.fd, [self.buf], 0)
+            if n < len(self.buf) or not whole:
+                return n
+            # 入りきらなかったのでバッファを広げて読み直す
+            self.buf = bytearray(len(self.buf) * 2)
+
+    def close(self):
+        os.close(self.fd)
+
+
+def scan_int(buf, pos, end):
+    """buf の pos から10進数を読み、(値, 読み終えた位置) を返す"""
+    while pos < end and (buf[pos] == 32 or buf[pos] == 9):
+        pos += 1
+    start = pos
+    value = 0
+    while pos < end:
+        c = buf[pos]
+        if c < 48 or c > 57:
+            break
+        value = value * 10 + c - 48
+        pos += 1
+    if pos == start:
+        raise ValueError(f"Number expected at offset {start}")
+    return value, pos
+
+
+class SystemSource:
+    """テレメトリの基底クラス"""
+    kind = None
+
+    def open(self):
+        return self
+
+    def read(self):
+        """0〜99 の値を返す"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class ProcCPUSource(SystemSource):
+    """/proc/stat の先頭行 (全CPUの合計) の差分からCPU使用率%を求める"""
+    kind = "cpu"
+
+    def open(self):
+        self._file = ProcFile("/proc/stat", 512)
+        self._total, self._idle = self._sample()
+        return self
+
+    def _sample(self):
+        f = self._file
+        n = f.read(whole=False)
+        buf = f.buf
+        end = buf.find(b"\n", 0, n)
+        # cpu  user nice system idle iowait irq softirq steal guest guest_nice
+        pos = 3
+        total = idle = 0
+        # guest は user に含まれているので steal までを足す
+        for i in range(8):
+            value, pos = scan_int(buf, pos, end)
+            total += value
+            if i == 3 or i == 4:
+                idle += value
+        return total, idle
+
+    def read(self):
+        try:
+            total, idle = self._sample()
+        except (OSError, ValueError, IndexError) as e:
+            raise SourceError(f"Failed to read /proc/stat: {e}")
+        delta_total = total - self._total
+        delta_idle = idle - self._idle
+        self._total, self._idle = total, idle
+        if delta_total <= 0:
+            return 0
+        return (delta_total - delta_idle) * 100 // delta_total
+
+    def close(self):
+        self._file.close()
+
+
+class ProcMemSource(SystemSource):
+    """/proc/meminfo の MemTotal と MemAvailable からRAM使用率%を求める"""
+    kind = "ram"
+
+    def open(self):
+        # 必要な行はファイルの先頭にある
+        self._file = ProcFile("/proc/meminfo", 256)
+        self.read()
+        return self
+
+    def _field(self, name, n):
+        buf = self._file.buf
+        start = buf.find(name, 0, n)
+        if start < 0:
+            raise SourceError(f"{name.decode()} not found in /proc/meminfo")
+        return scan_int(buf, start + len(name), n)[0]
+
+    def read(self):
+        try:
+            n = self._file.read(whole=False)
+            total = self._field(b"MemTotal:", n)
+            available = self._field(b"MemAvailable:", n)
+        except (OSError, ValueError) as e:
+            raise SourceError(f"Failed to read /proc/meminfo: {e}")
+        return (total - available) * 100 // total
+
+    def close(self):
+        self._file.close()
+
+
+class ProcNetSource(SystemSource):
+    """/proc/net/dev の送受信バイト数の差分から通信量 (unit Mbps 単位) を求める"""
+    kind = "net"
+
+    def __init__(self, unit=1.0, interfaces=None):
+        """
+        :param unit: 1 を表す通信量 (Mbps)
+        :param interfaces: 数えるインターフェース名 (省略時は lo 以外の全部)
+        """
+        self.unit_bytes = unit * 1_000_000 / 8
+        self.interfaces = tuple({name.encode() for name in interfaces}) if interfaces else None
+
+    def open(self):
+        self._file = ProcFile("/proc/net/dev", 4096)
+        self._bytes = self._sample()
+        self._at = time.monotonic()
+        return self
+
+    def _sample(self):
+        f = self._file
+        n = f.read()
+        buf = f.buf
+        interfaces = self.interfaces
+        total = 0
+        # 先頭2行は見出し
+        pos = buf.find(b"\n", buf.find(b"\n", 0, n) + 1, n) + 1
+        while pos < n:
+            end = buf.find(b"\n", pos, n)
+            if end < 0:
+                end = n
+            colon = buf.find(b":", pos, end)
+            if colon < 0:
+                raise ValueError("Interface name expected")
+            # インターフェース名は右寄せなので前の空白を飛ばし、名前はバッファ上で比べる
+            while buf[pos] == 32:
+                pos += 1
+            if interfaces is not None:
+                counted = False
+                for name in interfaces:
+                    if colon - pos == len(name) and buf.startswith(name, pos):
+                        counted = True
+                        break
+            else:
+                counted = not (colon - pos == 2 and buf.startswith(b"lo", pos))
+            if counted:
+                # 受信バイト数 (1列目) と送信バイト数 (9列目)
+                received, field = scan_int(buf, colon + 1, end)
+                for _ in range(7):
+                    _, field = scan_int(buf, field, end)
+                sent, _ = scan_int(buf, field, end)
+                total += received + sent
+            pos = end + 1
+        return total
+
+    def read(self):
+        try:
+            total = self._sample()
+        except (OSError, ValueError, IndexError) as e:
+            raise SourceError(f"Failed to read /proc/net/dev: {e}")
+        now = time.monotonic()
+        elapsed = now - self._at
+        delta = total - self._bytes
+        self._bytes, self._at = total, now
+        if elapsed <= 0 or delta < 0:
+            return 0
+        return int(delta / elapsed / self.unit_bytes)
+
+    def close(self):
+        self._file.close()
+
+
+class PsutilSource(SystemSource):
+    """Linux 以外用 (psutil)"""
+
+    def __init__(self, kind, unit=1.0, interfaces=None):
+        self.kind = kind
+        self.unit_bytes = unit * 1_000_000 / 8
+        self.interfaces = interfaces
+
+    def open(self):
+        try:
+            import psutil
+        except ImportError as e:
+            raise SourceError(f"psutil is not available: {e}")
+        self._psutil = psutil
+        if self.kind == "cpu":
+            # 最初の呼び出しは基準値を取るだけ
+            psutil.cpu_percent(None)
+        elif self.kind == "net":
+            self._bytes = self._net_bytes()
+            self._at = time.monotonic()
+        return self
+
+    def _net_bytes(self):
+        counters = self._psutil.net_io_counters(pernic=True)
+        return sum(
+            c.bytes_sent + c.bytes_recv for name, c in counters.items()
+            if (name in self.interfaces if self.interfaces else not name.startswith(("lo", "Loopback")))
+        )
+
+    def read(self):
+        psutil = self._psutil
+        if self.kind == "cpu":
+            return int(psutil.cpu_percent(None))
+        if self.kind == "ram":
+            return int(psutil.virtual_memory().percent)
+        total = self._net_bytes()
+        now = time.monotonic()
+        elapsed = now - self._at
+        delta = total - self._bytes
+        self._bytes, self._at = total, now
+        if elapsed <= 0 or delta < 0:
+            return 0
+        return int(delta / elapsed / self.unit_bytes)
+
+
+PROC_SOURCES = {
+    "cpu": ProcCPUSource,
+    "ram": ProcMemSource,
+    "net": ProcNetSource,
+}
+
+
+def open_source(kind, unit=1.0, interfaces=None):
+    """種類に合ったテレメトリを開いて返す (Linux は /proc、それ以外は psutil)"""
+    if kind not in KINDS:
+        raise SourceError(f"Unknown system source: {kind}")
+    if sys.platform.startswith("linux"):
+        source = ProcNetSource(unit, interfaces) if kind == "net" else PROC_SOURCES[kind]()
+    else:
+        source = PsutilSource(kind, unit, interfaces)
+    return source.open()
@@ -0,0 +1,122 @@
+"""
+ログ設定。
+
+送信ループのスレッドではキューに積むだけにして、ファイルやコンソールへの書き込みは
+QueueListener のスレッドで行う。ログファイルは日付が変わるか一定サイズを超えたら切り替える。
+"""
+import glob
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from datetime import datetime, timedelta
+
+LOG_PREFIX = "vrc_osc_watch"
+LOG_FORMAT = "%(asctime)s - %(message)s"
+
+_listener = None
+
+
+class DailyRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    vrc_osc_watch_YYYYMMDD.log に書き、日付が変わったら新しいファイルに切り替える。
+    同じ日のファイルが max_bytes を超えたら .1, .2 ... に退避する。
+    keep_days より古いログは切り替え時に削除する。
+    """
+
+    def __init__(self, log_dir, prefix=LOG_PREFIX, max_bytes=5 * 1024 * 1024, backup_count=5, keep_days=14):
+        self.log_dir = log_dir
+        self.prefix = prefix
+        self.keep_days = keep_days
+        self.rollover_at = self._next_midnight()
+        super().__init__(
+            self._path(datetime.now()),
+            mode="a",
+            maxBytes=max_bytes,
+            backupCount=backup_count,
+            encoding="utf-8",
+            delay=True,
+        )
+        self._cleanup()
+
+    def _path(self, now):
+        return os.path.join(self.log_dir, f"{self.prefix}_{now.strftime('%Y%m%d')}.log")
+
+    @staticmethod
+    def _next_midnight():
+        tomorrow = datetime.now().date() + timedelta(days=1)
+        return datetime.combine(tomorrow, datetime.min.time()).timestamp()
+
+    def shouldRollover(self, record):
+        if record.created >= self.rollover_at:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        if time.time() < self.rollover_at:
+            # サイズによる切り替え
+            super().doRollover()
+            return
+        # 日付による切り替え
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        self.baseFilename = os.path.abspath(self._path(datetime.now()))
+        self.rollover_at = self._next_midnight()
+        self._cleanup()
+
+    def _cleanup(self):
+        """古いログファイルを削除する"""
+        if not self.keep_days:
+            return
+        limit = time.time() - self.keep_days * 86400
+        for path in glob.glob(os.path.join(self.log_dir, f"{self.prefix}_*.log*")):
+            try:
+                if os.path.getmtime(path) < limit:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+def setup_logging(log_dir, name=LOG_PREFIX, level=logging.INFO):
+    """
+    ロガーを作成する。ロガーにはキューだけを付け、
+    ファイル・コンソールへの出力は別スレッドの QueueListener が行う。
+    """
+    global _listener
+    os.makedirs(log_dir, exist_ok=True)
+
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
+    if _listener is not None:
+        return logger
+
+    fmt = logging.Formatter(LOG_FORMAT)
+    handlers = []
+    file_handler = DailyRotatingFileHandler(log_dir)
+    file_handler.setFormatter(fmt)
+    handlers.append(file_handler)
+    # --noconsole でビルドした場合は stderr が無い
+    if sys.stderr is not None:
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(fmt)
+        handlers.append(stream_handler)
+
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.propagate = False
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return logger
+
+
+def stop_logging():
+    """キューに残っているログを書き出してリスナーを止める"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
@@ -0,0 +1,111 @@
+"""
+settings.json の読み書き。
+
+GUI とヘッドレスの両方から使うので、tkinter には依存しない。
+"""
+import copy
+import json
+import os
+
+
+# グループ毎の送信間隔 (秒) の初期値
+DEFAULT_RATES = {
+    "clock"  : 5.0,  # 時計の再送間隔 (分の切り替わりでは必ず送信)
+    "gpuMin" : 1.0,  # GPU/VRAMの最短サンプリング間隔 (値が変化している間)
+    "gpuMax" : 5.0,  # GPU/VRAMの最長サンプリング間隔 (値が落ち着いている間)
+    "chat"   : 5.0,  # チャットの送信間隔
+    "system" : 1.0,  # CPU/RAM/ネットワークの読み取り間隔
+}
+
+DEFAULT_SETTINGS = {
+    "defaultStart": True,
+    # メインの送信先
+    "ip": "127.0.0.1",
+    "port": 9000,
+    # GPUプロバイダ (auto / nvml / adlx / sysfs / fake)
+    "gpuProvider": "auto",
+    # auto で前回検出したGPU (provider, vendor, index, name, totalVram, driverVersion)
+    "gpuCache": None,
+    # 一緒に読むGPU ("all" またはインデックスのリスト) と、まとめ方 (max / sum / avg)
+    "gpuDevices": "all",
+    "gpuAggregate": "max",
+    # GPU毎のパラメータ ({"<GPUインデックス>": {"gpu": "GPU1", "vram": "VRAM1"}} で
+    # GPU1TenPlace / GPU1ZeroPlace などを送る)
+    "gpuParams": {},
+    # CPU/RAM/ネットワークのパラメータ ({"cpu": "CPU", "ram": "RAM", "net": "NET"} で
+    # CPUTenPlace / CPUZeroPlace などを送る。net は netUnitMbps を1とした通信量)
+    "systemSources": {},
+    "netUnitMbps": 1.0,
+    "netInterfaces": None,
+    # 1ティック分をまとめて1パケットで送信
+    "bundleMode": False,
+    "rates": DEFAULT_RATES,
+    # 追加の送信先 ([{"ip", "port", "params", "chat"}])
+    "destinations": [],
+    # パラメータの再送間隔・最短送信間隔 (paramRates でパラメータ毎に上書き)
+    "keepalive": 10.0,
+    "minSendGap": 0.0,
+    "paramRates": {},
+    # チャットボックスの送信 (refresh: 変化が無いときの再送間隔, rotate: プリセットを順番に流す,
+    # rotateInterval: 次のプリセットに進む間隔, tokenRate/tokenBurst: 送信数の上限)
+    "chat": {"refresh": 30.0, "rotate": False, "rotateInterval": 30.0, "tokenRate": 0.5, "tokenBurst": 3},
+    # GPUのバックグラウンドサンプリング (rate: 回/秒、0でティック毎に直接読む, window: まとめる秒数,
+    # mode: ema / max / percentile, hysteresis: 表示値を動かす最小の変化幅%)
+    "gpuSampling": {"rate": 10.0, "window": 2.0, "mode": "ema", "percentile": 0.9, "hysteresis": 2.0},
+    # グループ毎の送り方 (digits: 0〜9 の int 2つ / packed: 時計は Hour・Minute の int、
+    # GPU・VRAM・CPU等は <接頭辞> の float 1つ。float は 値/128 なのでアバター側で 128 倍して戻す)
+    "encoding": {"clock": "digits", "gpu": "digits", "system": "digits"},
+    # パラメータの割り当て ([{"source", "name", "digits", "type", "scale", "clamp", "address"}]、書き方は param_map.py)。
+    # None なら encoding・gpuParams・systemSources から作る
+    "paramMap": None,
+    # アバターの切り替えを受信ポートで監視し、アバターに無いパラメータは送らない
+    # (oscDir: VRChat の OSC 設定 JSON のフォルダ、省略時は LocalLow/VRChat/VRChat/OSC)
+    "avatarWatch": {"enabled": False, "port": 9001, "oscDir": None},
+    # ログレベル (DEBUGにすると毎ティックの送信内容も出す)
+    "logLevel": "INFO",
+    "logSummaryInterval": 60.0,
+    # 計測値を公開するポート (0で無効)
+    "metricsPort": 0,
+}
+
+
+def default_settings():
+    return copy.deepcopy(DEFAULT_SETTINGS)
+
+
+def load_settings(path):
+    """設定を読み込み、足りない項目を初期値で埋めて返す"""
+    settings = default_settings()
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            loaded = json.load(f)
+        settings.update(loaded)
+        settings["rates"] = {**DEFAULT_RATES, **loaded.get("rates", {})}
+        settings["chat"] = {**DEFAULT_SETTINGS["chat"], **loaded.get("chat", {})}
+        settings["gpuSampling"] = {**DEFAULT_SETTINGS["gpuSampling"], **loaded.get("gpuSampling", {})}
+        settings["avatarWatch"] = {**DEFAULT_SETTINGS["avatarWatch"], **loaded.get("avatarWatch", {})}
+        settings["encoding"] = {**DEFAULT_SETTINGS["encoding"], **loaded.get("encoding", {})}
+    return settings
+
+
+def engine_config(settings):
+    """SendEngine.start() に渡す設定を作る"""
+    return {
+        # メインの送信先 + 追加の送信先へ同じ内容を送る
+        "destinations": [{"ip": settings["ip"], "port": int(settings["port"])}] + list(settings["destinations"]),
+        "bundle": settings["bundleMode"],
+        "rates": dict(settings["rates"]),
+        "keepalive": settings["keepalive"],
+        "minSendGap": settings["minSendGap"],
+        "paramRates": settings["paramRates"],
+        "logSummaryInterval": settings["logSummaryInterval"],
+        "chat": dict(settings["chat"]),
+        "gpuSampling": dict(settings["gpuSampling"]),
+        "gpuParams": dict(settings["gpuParams"]),
+        "systemSources": dict(settings["systemSources"]),
+        "netUnitMbps": settings["netUnitMbps"],
+        "netInterfaces": settings["netInterfaces"],
+        "avatarWatch": dict(settings["avatarWatch"]),
+        "encoding": dict(settings["encoding"]),
+        "paramMap": settings["paramMap"],
+    }